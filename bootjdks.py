@@ -0,0 +1,231 @@
+# Boot JDKs, shared by create-all-codelines.py and run_builds.py.
+#
+# The JDKs are declared in bootjdks.json (next to this file): name -> url of the archive (a tar, optionally
+# compressed), its sha256 or the url of a checksum file published with it (sha256-url; "<digest>  <file name>",
+# like the .sha256.txt files of SapMachine releases), and the number of leading path components to strip when
+# unpacking. JDKs without url have to be installed manually into <openjdk-root>/jdks/<name>. Archives with
+# neither sha256 nor sha256-url cannot be verified; they are only downloaded if the caller explicitly allows it.
+#
+# Archives are kept in a content-addressed cache shared by all openjdk roots (~/.cache/ojdk-scripts):
+#   archives/sha256-<digest>   the archive
+#   urls/<sha1 of url>         the digest of the archive downloaded from that url
+#   trees/sha256-<digest>      the unpacked JDK; contains a marker file with the digest once complete
+# <openjdk-root>/jdks/<name> is a symlink to the unpacked tree.
+
+
+import pathlib
+import os
+import hashlib
+import json
+import re
+import shutil
+import tarfile
+import tempfile
+import urllib.request
+
+
+MANIFEST_FILE = str(pathlib.Path(__file__).parent / "bootjdks.json")
+
+TREE_MARKER_FILE = ".bootjdk-sha256"
+
+
+class BootJdkError(Exception):
+    pass
+
+
+def trc(text):
+    print("--- " + text)
+
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise BootJdkError("Cannot read boot jdk manifest " + manifest_file + ": " + str(e))
+
+
+def default_cache_dir():
+    return str(pathlib.Path.home() / ".cache" / "ojdk-scripts")
+
+
+def manifest_entry(manifest, name):
+    if name not in manifest:
+        raise BootJdkError("Unknown boot jdk " + name + " (not in " + MANIFEST_FILE + ").")
+    return manifest[name]
+
+
+def url_file(cache_dir, url):
+    return cache_dir + "/urls/" + hashlib.sha1(url.encode()).hexdigest()
+
+
+def archive_file(cache_dir, digest):
+    return cache_dir + "/archives/sha256-" + digest
+
+
+def tree_dir(cache_dir, digest):
+    return cache_dir + "/trees/sha256-" + digest
+
+
+# Returns the digest of the cached archive for this entry, or None if it is not in the cache
+def cached_archive_digest(entry, cache_dir):
+    digest = entry.get('sha256')
+    if digest is None and entry.get('url') is not None:
+        try:
+            with open(url_file(cache_dir, entry['url'])) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+    if digest is not None and os.path.isfile(archive_file(cache_dir, digest)):
+        return digest
+    return None
+
+
+# Returns the sha256 the archive must have: the one in the manifest, else the one in the checksum file at
+# sha256-url, else None.
+def expected_digest(entry):
+    if entry.get('sha256') is not None:
+        return entry['sha256']
+    checksum_url = entry.get('sha256-url')
+    if checksum_url is None:
+        return None
+    try:
+        with urllib.request.urlopen(checksum_url) as response:
+            fields = response.read(4096).decode("utf-8", errors="replace").split()
+    except OSError as e:
+        raise BootJdkError("Cannot download checksum " + checksum_url + ": " + str(e))
+    if len(fields) == 0 or not re.fullmatch(r'[0-9a-fA-F]{64}', fields[0]):
+        raise BootJdkError("No sha256 in " + checksum_url + ".")
+    return fields[0].lower()
+
+
+# Downloads the archive into the cache (unless it is there already). The download is streamed into a
+# temporary file in the cache and hashed on the way; only a complete and verified archive is moved to its
+# place. Returns the digest.
+# allow_unverified: download the archive even if it cannot be verified (with a warning)
+def download_archive(entry, cache_dir, allow_unverified=False):
+    digest = cached_archive_digest(entry, cache_dir)
+    if digest is not None:
+        return digest
+    url = entry.get('url')
+    if url is None:
+        raise BootJdkError("No url; " + entry.get('note', "install manually."))
+    expected = expected_digest(entry)
+    if expected is None and not allow_unverified:
+        raise BootJdkError("No sha256 or sha256-url for " + url + " in the manifest, refusing to download an "
+                           "archive we cannot verify. Add its sha256 to the manifest, or allow unverified "
+                           "downloads (create-all-codelines.py --allow-unverified-jdks).")
+    pathlib.Path(cache_dir + "/archives").mkdir(parents=True, exist_ok=True)
+    pathlib.Path(cache_dir + "/urls").mkdir(parents=True, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir + "/archives", prefix=".download-")
+    try:
+        sha256 = hashlib.sha256()
+        with os.fdopen(fd, mode='wb') as out, urllib.request.urlopen(url) as response:
+            while True:
+                data = response.read(1024 * 1024)
+                if not data:
+                    break
+                sha256.update(data)
+                out.write(data)
+        digest = sha256.hexdigest()
+        if expected is not None and expected != digest:
+            raise BootJdkError("Checksum mismatch for " + url + ": expected " + expected + ", got " + digest)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, archive_file(cache_dir, digest))
+    except OSError as e:
+        raise BootJdkError("Cannot download " + url + ": " + str(e))
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    with open(url_file(cache_dir, url), mode='w') as f:
+        f.write(digest + "\n")
+    if expected is None:
+        print("*** WARNING: " + url + " was NOT verified (no sha256 in the manifest). Its sha256 is " + digest +
+              "; check it against the vendor's checksum and add it to the manifest.")
+    return digest
+
+
+def stripped_name(name, strip_components):
+    parts = [p for p in name.split("/") if p not in ("", ".")][strip_components:]
+    if len(parts) == 0:
+        return None
+    if ".." in parts:
+        raise BootJdkError("Refusing to unpack " + name + ".")
+    return "/".join(parts)
+
+
+# Unpacks the archive, streaming, into a temporary directory next to the final tree, which is renamed into
+# place when complete.
+def unpack_archive(archive, target_dir, strip_components, digest):
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(target_dir), prefix=".unpack-")
+    # where available, let tarfile refuse members pointing outside of the target directory
+    extract_filter = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+    try:
+        os.chmod(tmp_dir, 0o755)
+        with tarfile.open(archive, mode='r|*') as tar:
+            for member in tar:
+                name = stripped_name(member.name, strip_components)
+                if name is None:
+                    continue
+                member.name = name
+                if member.islnk():
+                    member.linkname = stripped_name(member.linkname, strip_components)
+                tar.extract(member, tmp_dir, **extract_filter)
+        with open(tmp_dir + "/" + TREE_MARKER_FILE, mode='w') as f:
+            f.write(digest + "\n")
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        os.rename(tmp_dir, target_dir)
+    except (OSError, tarfile.TarError) as e:
+        raise BootJdkError("Cannot unpack " + archive + ": " + str(e))
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def is_complete_tree(directory, digest):
+    try:
+        with open(directory + "/" + TREE_MARKER_FILE) as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+
+# Unpacks the cached archive (see download_archive) into the cache, unless that has been done already,
+# and links <jdks_dir>/<name> to it.
+def install_jdk(name, entry, jdks_dir, cache_dir):
+    digest = cached_archive_digest(entry, cache_dir)
+    if digest is None:
+        raise BootJdkError(name + ": archive not in cache, download it first.")
+    target_dir = tree_dir(cache_dir, digest)
+    if is_complete_tree(target_dir, digest):
+        trc(name + ": using unpacked tree in cache.")
+    else:
+        pathlib.Path(cache_dir + "/trees").mkdir(parents=True, exist_ok=True)
+        unpack_archive(archive_file(cache_dir, digest), target_dir, entry.get('strip-components', 0), digest)
+    link = jdks_dir + "/" + name
+    if os.path.islink(link):
+        if os.readlink(link) == target_dir:
+            return
+        os.remove(link)
+    elif os.path.exists(link):
+        # installed manually, or by an older version of create-all-codelines.py
+        trc(link + " exists and is not a link to the cache, leaving it alone.")
+        return
+    os.symlink(target_dir, link)
+
+
+# Returns the directory of the given boot jdk: <jdks_dir>/<name> if it exists (a link to the cache or a
+# manually installed JDK), else the unpacked tree in the cache, else None.
+def resolve_jdk(name, jdks_dir, cache_dir=None, manifest=None):
+    if os.path.isdir(jdks_dir + "/" + name):
+        return jdks_dir + "/" + name
+    cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+    manifest = manifest if manifest is not None else load_manifest()
+    entry = manifest.get(name)
+    if entry is None:
+        return None
+    digest = cached_archive_digest(entry, cache_dir)
+    if digest is not None and is_complete_tree(tree_dir(cache_dir, digest), digest):
+        return tree_dir(cache_dir, digest)
+    return None
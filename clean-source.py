@@ -1,14 +1,23 @@
 # !/usr/bin/env python3
 
-# (Note: hotspot files modified in a patch:
-# ack '\+\+\+ b/src/hotspot' jep387-all.patch | sed 's/+++ b\///g'
-# ack '\+\+\+ b/test/hotspot/gtest' jep387-all.patch | sed 's/+++ b\///g'
+# (Note: to only process the hotspot files modified in a patch, use --from-patch-file, --git-diff or --staged)
 
 
 import pathlib
 import sys
 import os
 import argparse
+import hashlib
+import json
+import io
+import contextlib
+import multiprocessing
+import fnmatch
+import itertools
+import re
+import subprocess
+import tempfile
+import stat
 
 
 def trc(text):
@@ -45,125 +54,138 @@ def should_process_this_file(filename):
     return is_source_file(filename) or is_header_file(filename)
 
 
-# given a directory, find files in it to process and add to output list
-def find_files_to_process(directory):
-    return_list = []
-    files_in_dir = os.listdir(directory)
-    for f in files_in_dir:
-        f_full = directory + "/" + f
-        if os.path.isdir(f_full):
-            return_list = return_list + find_files_to_process(f_full)
-        else:
-            if should_process_this_file(f_full):
-                return_list.append(f_full)
-    return return_list
+# Directories and files we never want to descend into or process when walking recursively.
+DEFAULT_EXCLUDES = [".git", ".hg", "build", "output-*", "gensrc"]
+
 
+# an entry is excluded if its name or its path relative to the walk root matches an exclude glob
+def is_excluded(name, relative_path):
+    for glob in args.excludes:
+        if fnmatch.fnmatch(name, glob) or fnmatch.fnmatch(relative_path, glob):
+            return True
+    return False
 
-def is_nonempty_line(line):
-    if line.strip() != "":
+
+# if include globs are given, a file is only processed if its name or its relative path match one of them
+def is_included(name, relative_path):
+    if len(args.includes) == 0:
         return True
-    else:
-        return False
+    for glob in args.includes:
+        if fnmatch.fnmatch(name, glob) or fnmatch.fnmatch(relative_path, glob):
+            return True
+    return False
+
+
+# given a directory, yield files in it to process, recursively.
+# We use scandir, which mostly knows whether an entry is a directory without an extra stat.
+# Symbolic links to directories are not followed (they could form a loop).
+def find_files_to_process(directory, relative_dir=""):
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        relative_path = relative_dir + entry.name
+        if is_excluded(entry.name, relative_path):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from find_files_to_process(entry.path, relative_path + "/")
+        elif should_process_this_file(entry.name) and is_included(entry.name, relative_path):
+            yield entry.path
+
+
+# The fixers below are streaming stages: each one takes an iterator of lines and yields the fixed lines.
+# They are chained into one pipeline (see fix_pipeline), so a file is processed in a single pass,
+# without building intermediate line lists.
+# If a stage does not dare to fix a file, it raises UnclearFile.
+class UnclearFile(Exception):
+    pass
+
 
 # Given a number of lines, fix an include block according to hotspot rules
 #   - sort all includes alphabetically
 #   - remove empty lines in include block
 #   - for source files, prepend precompiled header
-# It modifies the input list.
-# Returns True if successful, False if not
 def fix_include_block(lines, is_source_file):
 
-    line_no = 0
-    first_include_line_no = -1
-    last_include_line_no = -1
+    include_lines = []   # the include block (without empty lines) seen so far
+    empty_lines = []     # empty lines following the last include seen so far
+    state = "before"     # before, in or after the include block
 
-    # Extract include section.
     for line in lines:
+        if state == "after":
+            yield line
+            continue
         line_stripped = line.strip()
-        if first_include_line_no == -1:
-            if line_stripped.startswith('#include'):
-                first_include_line_no = line_no
-                last_include_line_no = line_no
+        if line_stripped.startswith('#include'):
+            # empty lines inside the include block are dropped
+            include_lines.append(line)
+            empty_lines.clear()
+            state = "in"
+        elif state == "in" and line_stripped == "":
+            empty_lines.append(line)
+        elif state == "in":
+            # found first non-include line. We are done with the include block.
+            yield from sorted_include_block(include_lines, is_source_file)
+            yield from empty_lines
+            state = "after"
+            yield line
         else:
-            if line_stripped.startswith('#include'):
-                last_include_line_no = line_no
-            else:
-                if line_stripped != "":
-                    # found first non-include line. We are done.
-                    break
-        line_no += 1
+            yield line
 
-    if first_include_line_no == -1:
+    if state == "in":
+        yield from sorted_include_block(include_lines, is_source_file)
+        yield from empty_lines
+    elif state == "before":
         trc("Did not find include section.")
         if is_source_file:
-            return False
-        else:
-            return True  # accept this for headers.
+            raise UnclearFile()
+        # accept this for headers.
 
-    include_lines = lines[first_include_line_no: last_include_line_no + 1]
 
+def sorted_include_block(include_lines, is_source_file):
     # Special rule applies for cpp files: whatever we sort, precompiled.cpp
-    # shall be the first include. We remove the include before sorting and re-insert
-    # it afterwards.
-    include_precompiled = None
+    # shall be the first include.
     if is_source_file:
         if include_lines[0].strip() != '#include \"precompiled.hpp\"':
             trc("Weird: did not find precompiled.hpp at first position. Found: " + include_lines[0])
-            return False
-        include_precompiled = include_lines[0]
-        del include_lines[0]
-
-    # remove empty lines from includes
-    include_lines = list(filter(is_nonempty_line, include_lines))
-
-    # Sort the includes.
-    include_lines.sort()
-
-    # re-add precompiled.hpp at pos 0
-    if include_precompiled is not None:
-        include_lines.insert(0, include_precompiled)
-
-    # Now exchange the includes in the original lines
-    lines[first_include_line_no: last_include_line_no + 1] = include_lines
-
-    return True
+            raise UnclearFile()
+        return include_lines[:1] + sorted(include_lines[1:])
+    return sorted(include_lines)
 
 
 # Given a number of lines, squash all multiple empty lines into one
-# It modifies the input list.
-# Returns True if successful, False if not
 def squash_multiple_empty_lines(lines):
     had_empty_line = False
-    lines2 = []
     for line in lines:
         if line.strip() == "":
-            if had_empty_line:
-                pass
-            else:
-                lines2.append(line)
+            if not had_empty_line:
+                yield line
                 had_empty_line = True
         else:
-            lines2.append(line)
+            yield line
             had_empty_line = False
-    lines[:] = lines2
-    return True
+
+
+def has_whitespace_issues(line):
+    return (line[-2:-1].isspace() or not line.endswith("\n") or '\t' in line or
+            ' for(' in line or ' while(' in line)
 
 
 # Given a number of lines, fix my common whitespace issues:
 #  - remove trailing white spaces
 #  - exchange tab to two spaces
 #  - add a space after loop keywords (for, while)
-# Returns True if successful, False if not
-def fix_whitespaces(lines):
-    lines2 = []
-    for line in lines:
+# If only_line_numbers is given (a set of 1-based line numbers), only fix those lines.
+def fix_whitespaces(lines, only_line_numbers=None):
+    for line_no, line in enumerate(lines, start=1):
+        # most lines are fine; pass them on as they are
+        if not has_whitespace_issues(line) or (only_line_numbers is not None and line_no not in only_line_numbers):
+            yield line
+            continue
         line_stripped = line.rstrip()
         line_stripped = line_stripped.replace('\t', '  ')
         line_stripped = line_stripped.replace(' for(', ' for (')
         line_stripped = line_stripped.replace(' while(', ' while (')
-        lines2.append(line_stripped + "\n")
-    lines[:] = lines2
-    return True
+        yield line_stripped + "\n"
 
 
 def form_include_guard_name(full_path_of_header):
@@ -177,39 +199,500 @@ def form_include_guard_name(full_path_of_header):
     return f
 
 
-# fix include guards.
+# fix include guards (just the first ifndef define pair, and the last endif).
 def fix_include_guards(lines, full_path_of_header):
 
-    line_no = 0
-    lineno_ifdef = -1
-    lineno_def = -1
-    lineno_endif = -1
-
     include_guard_name = form_include_guard_name(full_path_of_header)
     if include_guard_name == "":
-        return False
+        raise UnclearFile()
+
+    found_ifdef = False
+    found_def = False
+    pending = []   # a candidate closing #endif, and the empty lines following it
 
-    # search include guard definition (just the first ifdef define pair)
     for line in lines:
-        if lineno_ifdef == -1 and line.startswith('#ifndef '):
-            lineno_ifdef = line_no
-        elif lineno_ifdef != -1 and lineno_def == -1:
+        if not found_ifdef:
+            if line.startswith('#ifndef '):
+                found_ifdef = True
+                line = "#ifndef " + include_guard_name + "\n"
+            yield line
+        elif not found_def:
             if not line.strip().startswith('#define'):
                 trc("malformed include guard?")
-                return False
-            lineno_def = line_no
-        elif lineno_ifdef != -1 and lineno_def != -1:
+                raise UnclearFile()
+            found_def = True
+            yield "#define " + include_guard_name + "\n"
+        elif line.startswith('#endif'):
+            yield from pending
+            pending = [line]
+        elif pending and line.strip() == "":
+            pending.append(line)
+        else:
+            # not the last endif after all
+            yield from pending
+            pending.clear()
+            yield line
+
+    if not pending:
+        trc("Did not find include guard.")
+        raise UnclearFile()
+    yield "#endif // " + include_guard_name + "\n"
+    yield from pending[1:]
+
+
+# Chain all fixes we run into one pipeline over the lines of file f
+def fix_pipeline(lines, f, changed_lines):
+    # If we only fix whitespaces in changed lines, do this first, while the line numbers from the diff
+    # are still valid.
+    if changed_lines is not None and (args.fix_whitespaces or args.allall):
+        lines = fix_whitespaces(lines, changed_lines)
+
+    if args.fix_include_blocks or args.allall:
+        lines = fix_include_block(lines, is_source_file(f))
+
+    if args.squash_empty_lines or args.allall:
+        lines = squash_multiple_empty_lines(lines)
+
+    if changed_lines is None and (args.fix_whitespaces or args.allall):
+        lines = fix_whitespaces(lines)
+
+    if args.fix_include_guards or args.allall:
+        if is_header_file(f):
+            lines = fix_include_guards(lines, str(pathlib.Path(f).absolute()))
+
+    return lines
+
+
+# Run the pipeline over the input lines. Returns None if the file is fine, the fixed lines otherwise.
+# As long as the pipeline yields the input lines unchanged, we don't build any output; for files that
+# are already clean (the common case), no copy is made at all.
+def run_fix_pipeline(input_lines, f, changed_lines):
+    output = fix_pipeline(iter(input_lines), f, changed_lines)
+    line_no = 0
+    for line in output:
+        if line_no >= len(input_lines) or line != input_lines[line_no]:
+            return input_lines[:line_no] + [line] + list(output)
+        line_no += 1
+    if line_no != len(input_lines):
+        return input_lines[:line_no]
+    return None
+
+
+#####################
+# Check mode: instead of fixing files, report violations of the rules the fixers enforce, with a rule ID.
+# The checks run in one pass over the input lines and never build any output. By default we stop checking
+# a rule in a file after its first violation; we stop reading the file once all rules have been violated.
+
+RULES_BY_FIX = {
+    "include-blocks": ("include-order",),
+    "squash-empty-lines": ("double-blank-line",),
+    "whitespaces": ("trailing-whitespace", "tab", "loop-spacing", "final-newline"),
+    "include-guards": ("include-guard",),
+}
+
+
+# returns the check rules that correspond to the given fixes (see enabled_fixes), or all if no fixes are given
+def enabled_rules(fixes):
+    rules = []
+    for fix, fix_rules in RULES_BY_FIX.items():
+        if fixes == "" or fix in fixes.split(","):
+            rules.extend(fix_rules)
+    return rules
+
+
+# Yields (line number, rule, message) for every line that violates one of the whitespace or empty line rules.
+def check_line_rules(line_no, line, previous_line_empty, rules):
+    if "trailing-whitespace" in rules and line.rstrip("\n") != line.rstrip():
+        yield line_no, "trailing-whitespace", "trailing whitespace"
+    if "tab" in rules and '\t' in line:
+        yield line_no, "tab", "tab character"
+    if "loop-spacing" in rules and (' for(' in line or ' while(' in line or
+                                    ('\t' in line and ('\tfor(' in line or '\twhile(' in line))):
+        yield line_no, "loop-spacing", "missing space after for/while"
+    if "final-newline" in rules and not line.endswith("\n"):
+        # (only the last line can lack the newline)
+        yield line_no, "final-newline", "no newline at end of file"
+    if "double-blank-line" in rules and previous_line_empty and line.strip() == "":
+        yield line_no, "double-blank-line", "multiple empty lines"
+
+
+# Returns a diagnostic (line number, rule, message) if the include block is not in order, otherwise None
+def check_include_block(include_lines, is_source_file):
+    first_line_no = include_lines[0][0]
+    if is_source_file and include_lines[0][1].strip() != '#include "precompiled.hpp"':
+        return first_line_no, "include-order", "precompiled.hpp is not the first include"
+    previous = None
+    for line_no, line in include_lines[1:] if is_source_file else include_lines:
+        if line.strip() == "":
+            return line_no, "include-order", "empty line in include block"
+        if previous is not None and line < previous:
+            return line_no, "include-order", "include not in alphabetical order: " + line.strip()
+        previous = line
+    return None
+
+
+# Yields the diagnostics (line number, rule, message) for file f.
+# If changed_lines is given, whitespace and empty line rules are only checked for these lines.
+def check_file(lines, f, rules, changed_lines, full_report):
+    rules = set(rules)
+    guard_name = None
+    if "include-guard" in rules:
+        guard_name = form_include_guard_name(str(pathlib.Path(f).absolute())) if is_header_file(f) else ""
+        if guard_name == "":
+            rules.discard("include-guard")
+
+    line_rules = rules & {"trailing-whitespace", "tab", "loop-spacing", "final-newline", "double-blank-line"}
+    include_lines = []         # (line number, line) of the include block seen so far (including empty lines)
+    include_state = "before" if "include-order" in rules else "after"
+    guard_state = "ifndef" if guard_name else "done"
+    last_endif = None          # (line number, line) of the last #endif followed only by empty lines
+    previous_line_empty = False
+
+    def report(diagnostic):
+        if not full_report:
+            rules.discard(diagnostic[1])
+            line_rules.discard(diagnostic[1])
+        return diagnostic
+
+    for line_no, line in enumerate(lines, start=1):
+        if len(rules) == 0:
+            return
+
+        line_empty = line.strip() == ""
+
+        if line_rules and (changed_lines is None or line_no in changed_lines):
+            for diagnostic in list(check_line_rules(line_no, line, previous_line_empty, line_rules)):
+                yield report(diagnostic)
+        previous_line_empty = line_empty
+
+        if include_state != "after":
+            if line.strip().startswith('#include'):
+                include_lines.append((line_no, line))
+                include_state = "in"
+            elif include_state == "in" and line_empty:
+                include_lines.append((line_no, line))
+            elif include_state == "in":
+                include_state = "after"
+                while include_lines[-1][1].strip() == "":
+                    include_lines.pop()
+                diagnostic = check_include_block(include_lines, is_source_file(f))
+                if diagnostic is not None:
+                    yield report(diagnostic)
+
+        if guard_state == "ifndef" and line.startswith('#ifndef '):
+            if line.rstrip() != "#ifndef " + guard_name:
+                yield report((line_no, "include-guard", "include guard should be " + guard_name))
+            guard_state = "define"
+        elif guard_state == "define":
+            if line.rstrip() != "#define " + guard_name and "include-guard" in rules:
+                yield report((line_no, "include-guard", "include guard should be " + guard_name))
+            guard_state = "endif"
+        elif guard_state == "endif":
             if line.startswith('#endif'):
-                lineno_endif = line_no
+                last_endif = (line_no, line)
             elif line.strip() != "":
-                lineno_endif = -1
-        line_no += 1
+                last_endif = None
+
+    if include_state == "in" and "include-order" in rules:
+        while include_lines[-1][1].strip() == "":
+            include_lines.pop()
+        diagnostic = check_include_block(include_lines, is_source_file(f))
+        if diagnostic is not None:
+            yield report(diagnostic)
+    elif include_state == "before" and is_source_file(f):
+        yield report((1, "include-order", "no include section found"))
+
+    if "include-guard" in rules:
+        if guard_state != "endif" or last_endif is None:
+            yield report((1, "include-guard", "no include guard found"))
+        elif last_endif[1].rstrip() != "#endif // " + guard_name:
+            yield report((last_endif[0], "include-guard", "include guard should be closed by #endif // " + guard_name))
+
+
+def format_diagnostic(f, diagnostic):
+    line_no, rule, message = diagnostic
+    return f + ":" + str(line_no) + ": error: " + message + " [" + rule + "]"
+
+
+#####################
+# Selecting files from a diff (a patch file, git diff <rev> or the git index)
+
+# We only care for hotspot sources and hotspot gtests
+PATCH_PATH_PREFIXES = ("src/hotspot/", "test/hotspot/gtest/")
+
+hunk_header_regex = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+# Given the lines of a unified diff, return a dict: file path (as in the diff, relative to the repository root)
+# -> set of line numbers added or changed in the new version of the file. Deleted files are omitted.
+def parse_unified_diff(diff_lines):
+    changed_files = {}
+    current = None
+    new_line_no = 0
+    lines_left = 0
+    for line in diff_lines:
+        line = line.rstrip('\n')
+        if lines_left > 0:
+            # inside a hunk
+            if line.startswith('+'):
+                current.add(new_line_no)
+                new_line_no += 1
+                lines_left -= 1
+            elif line.startswith(' ') or line == "":
+                new_line_no += 1
+                lines_left -= 1
+            # '-' lines and "\ No newline at end of file" don't count on the new side
+            continue
+        if line.startswith('+++ '):
+            path = line[4:].split('\t')[0]
+            if path == "/dev/null":
+                current = None
+            else:
+                if path.startswith("b/"):
+                    path = path[2:]
+                current = changed_files.setdefault(path, set())
+        elif current is not None:
+            m = hunk_header_regex.match(line)
+            if m is not None:
+                new_line_no = int(m.group(1))
+                lines_left = int(m.group(2)) if m.group(2) is not None else 1
+    return changed_files
+
+
+def git_output(git_args):
+    try:
+        return subprocess.check_output(["git"] + git_args).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError) as e:
+        error_exit("git " + " ".join(git_args) + " failed: " + str(e))
+
+
+# Returns (root directory the diff paths are relative to, diff lines, paths to skip), or None if no diff source
+# was given
+def read_selection_diff():
+    if args.from_patch_file is not None:
+        with open(args.from_patch_file, errors='replace') as f:
+            return args.patch_root, f.readlines(), set()
+    if args.git_diff is not None or args.staged:
+        root = git_output(["rev-parse", "--show-toplevel"]).strip()
+        # explicit prefixes and root relative paths, regardless of diff.noprefix, diff.mnemonicPrefix or
+        # diff.relative in the user's git config
+        diff_args = ["diff", "--no-color", "--no-ext-diff", "--no-relative", "--src-prefix=a/", "--dst-prefix=b/",
+                     "-U0"]
+        if args.staged:
+            diff_args.append("--cached")
+        if args.git_diff is not None:
+            diff_args.append(args.git_diff)
+        skipped_paths = set()
+        if args.staged and args.changed_lines_only:
+            # The line numbers of the diff are those of the index. We fix the working tree file, so we can only
+            # use them if the file has no unstaged changes.
+            skipped_paths = set(git_output(["diff", "--no-ext-diff", "--no-relative", "--name-only"]).splitlines())
+        return root, git_output(diff_args).splitlines(), skipped_paths
+    return None
+
+
+# yields (file name, set of changed line numbers) for all hotspot source files touched by the diff
+def find_files_to_process_from_diff(root, diff_lines, skipped_paths):
+    for path, changed_lines in parse_unified_diff(diff_lines).items():
+        if not path.startswith(PATCH_PATH_PREFIXES) or not should_process_this_file(path):
+            continue
+        f = os.path.relpath(os.path.join(root, path))
+        if path in skipped_paths:
+            trc(f + " has unstaged changes, skipping (the changed lines of the index do not apply).")
+            continue
+        if not os.path.exists(f):
+            trc(f + " not found, skipping.")
+            continue
+        yield f, changed_lines
+
+
+#####################
+# Processing cache: for every file we remember size, mtime, content hash, the fixes applied and the
+# result. If a file did not change since it was last processed with the same fixes, we don't even
+# open it again.
+
+# bump whenever the fixers change behavior, to invalidate old caches
+CACHE_VERSION = 3
+
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            verbose(str(len(cache['files'])) + " cache entries loaded from " + cache_file)
+            return cache['files']
+        verbose("Ignoring outdated cache " + cache_file)
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_cache(cache_file, cache_entries):
+    pathlib.Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, mode='w') as f:
+        json.dump({'version': CACHE_VERSION, 'files': cache_entries}, f)
+    os.replace(tmp_file, cache_file)
+
+
+# returns a string naming the fixes we run; cache entries are only valid for the same set of fixes
+def enabled_fixes():
+    fixes = []
+    if args.fix_include_blocks or args.allall:
+        fixes.append("include-blocks")
+    if args.squash_empty_lines or args.allall:
+        fixes.append("squash-empty-lines")
+    if args.fix_whitespaces or args.allall:
+        fixes.append("whitespaces")
+    if args.fix_include_guards or args.allall:
+        fixes.append("include-guards")
+    return ",".join(fixes)
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# returns the newline convention of a file: the one most of its lines use
+def newline_of(data):
+    crlf = data.count(b"\r\n")
+    return "\r\n" if crlf > data.count(b"\n") - crlf else "\n"
+
+
+def lines_to_bytes(lines, newline):
+    text = "".join(lines)
+    if newline != "\n":
+        text = text.replace("\n", newline)
+    return text.encode('utf-8', errors='surrogateescape')
+
+
+# Write data to file f via a temporary file in the same directory, which then replaces f. An interrupted run
+# thus never leaves a truncated file behind. The permissions of the original file (st) are kept.
+# If f is a symbolic link, the file it points to is replaced, not the link.
+def write_file_atomically(f, data, st):
+    f = os.path.realpath(f)
+    directory, name = os.path.split(f)
+    fd, tmp_file = tempfile.mkstemp(dir=directory, prefix="." + name + ".")
+    try:
+        with os.fdopen(fd, mode='wb') as file_out:
+            file_out.write(data)
+        os.chmod(tmp_file, stat.S_IMODE(st.st_mode))
+        os.replace(tmp_file, f)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+
+# Process a single file.
+# Returns a tuple (result, cache entry, diagnostics), with result being one of
+#  "unchanged"  - file is fine
+#  "changed"    - file needed fixing (and was fixed, unless in dry-run mode)
+#  "unclear"    - we did not dare to fix the file
+#  "violations" - (--check only) file violates rules
+# the cache entry describing the file as we found it, and (--check only) the list of diagnostics.
+# If changed_lines is given (a set of 1-based line numbers), whitespace fixes are limited to these lines.
+def process_file(f, fixes, cached, changed_lines=None):
+    st = os.stat(f)
+    cached_ok = cached is not None and cached['fixes'] == fixes and cached['result'] in ("unchanged", "unclear")
+
+    if cached_ok and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime_ns:
+        verbose("Skipping " + f + " (unchanged since last run)")
+        return cached['result'], cached, []
+
+    # Read in file
+    with open(f, mode='rb') as file_in:
+        data = file_in.read()
+
+    entry = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': content_hash(data), 'fixes': fixes}
+
+    # mtime changed, but content did not (e.g. touched, or switched branches back and forth)
+    if cached_ok and cached['hash'] == entry['hash']:
+        verbose("Skipping " + f + " (content unchanged since last run)")
+        entry['result'] = cached['result']
+        return entry['result'], entry, []
+
+    verbose("Processing " + f + "...")
+
+    if args.check:
+        lines = io.StringIO(data.decode('utf-8', errors='surrogateescape'), newline=None)
+        diagnostics = sorted(check_file(lines, f, enabled_rules(enabled_fixes()), changed_lines, args.full_report))
+        entry['result'] = "violations" if len(diagnostics) > 0 else "unchanged"
+        return entry['result'], entry, diagnostics
+
+    # (universal newlines, like reading the file in text mode)
+    input_lines = io.StringIO(data.decode('utf-8', errors='surrogateescape'), newline=None).readlines()
+
+    verbose(str(len(input_lines)) + " lines read...")
+
+    try:
+        output_lines = run_fix_pipeline(input_lines, f, changed_lines)
+    except UnclearFile:
+        # ignore files which feel iffy
+        entry['result'] = "unclear"
+        return entry['result'], entry, []
+
+    # output: if any of the fixes changed the file, and dry-run is not active,
+    # write out the changed file. We compare on byte level, in the file's newline convention and encoding,
+    # so that a file is only ever rewritten (and its mtime bumped) if its content really changes.
+    new_data = None
+    if output_lines is not None:
+        new_data = lines_to_bytes(output_lines, newline_of(data))
+    if new_data is not None and new_data != data:
+        entry['result'] = "changed"
+        if not args.dry_run:
+            write_file_atomically(f, new_data, st)
+    else:
+        entry['result'] = "unchanged"
+
+    return entry['result'], entry, []
+
+
+# yields (file name, set of changed lines or None) for all files to process: the files touched by the selection
+# diff (see read_selection_diff), if given, and the files given on the command line.
+def find_all_files_to_process(selection_diff):
+    if selection_diff is not None:
+        yield from find_files_to_process_from_diff(*selection_diff)
+    for f in args.files:
+        if os.path.isdir(f) and args.recursive:
+            for f2 in find_files_to_process(f):
+                yield f2, None
+        else:
+            if should_process_this_file(f):
+                yield f, None
+
+
+# yields the work items (see process_file_captured) for all files to process.
+# Note: when only fixing changed lines, the result depends on the diff, so we neither use nor update the cache
+def work_items(selection_diff, fixes, cache_entries):
+    for f, changed_lines in find_all_files_to_process(selection_diff):
+        key = str(pathlib.Path(f).absolute())
+        if args.changed_lines_only:
+            yield f, key, fixes, None, changed_lines
+        else:
+            yield f, key, fixes, cache_entries.get(key), None
+
+
+# Feeds the work items to the pool in batches, and yields the results in order. Pool.imap would drain the
+# whole (lazy) work item iterator right away; this way, at most one batch is pending at any time.
+def process_in_batches(pool, items, batch_size):
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if len(batch) == 0:
+            return
+        yield from pool.imap(process_file_captured, batch, chunksize=16)
+
 
-    lines[lineno_ifdef] = "#ifndef " + include_guard_name + "\n"
-    lines[lineno_def] = "#define " + include_guard_name + "\n"
-    lines[lineno_endif] = "#endif // " + include_guard_name + "\n"
+# Worker function for parallel processing: processes a file and captures everything printed
+# while doing so, so that the main process can print output in a deterministic order.
+# Returns (result, cache entry, captured output).
+def process_file_captured(work_item):
+    f, key, fixes, cached, changed_lines = work_item
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured):
+        result, entry, diagnostics = process_file(f, fixes, cached, changed_lines)
+    return f, key, result, entry, diagnostics, captured.getvalue()
 
-    return True
 
 #####################
 
@@ -239,87 +722,145 @@ parser.add_argument("-n", "--squash-empty-lines", dest="squash_empty_lines", def
 parser.add_argument("-a", "--all", dest="allall", default=False,
                     help="Run all fixes.", action="store_true")
 
-parser.add_argument("--from-patch-file", dest="from_patch_file", default=False,
-                    help="use a patch file to find out which files to test.", action="store_true")
+parser.add_argument("--from-patch-file", dest="from_patch_file", default=None, metavar="PATCH",
+                    help="Process the hotspot files (src/hotspot, test/hotspot/gtest) touched by a unified diff.")
+
+parser.add_argument("--patch-root", dest="patch_root", default=".", metavar="DIR",
+                    help="Directory the paths in the patch file are relative to. Default: current directory.")
+
+parser.add_argument("--git-diff", dest="git_diff", default=None, metavar="REV",
+                    help="Process the hotspot files changed in the working tree relative to REV (git diff REV).")
+
+parser.add_argument("--staged", dest="staged", default=False, action="store_true",
+                    help="Process the hotspot files changed in the git index (git diff --cached).")
+
+parser.add_argument("--changed-lines-only", dest="changed_lines_only", default=False, action="store_true",
+                    help="With --from-patch-file, --git-diff or --staged: only fix whitespaces in lines the diff "
+                         "adds or changes. With --staged, files with unstaged changes are skipped.")
+
+parser.add_argument("--check", dest="check", default=False, action="store_true",
+                    help="Don't fix anything, just report rule violations and exit with 1 if there are any. Checks the "
+                         "rules of the selected fixes (-i, -g, -w, -n), or all rules if no fix is selected.")
+
+parser.add_argument("--format", dest="format", default="gcc", choices=["gcc", "json"],
+                    help="--check: output format for diagnostics, compiler style or json. Default: %(default)s.")
+
+parser.add_argument("--full-report", dest="full_report", default=False, action="store_true",
+                    help="--check: report all violations. By default, only the first violation per rule and file "
+                         "is reported.")
+
+parser.add_argument("-j", "--jobs", dest="jobs", default=1, type=int, metavar="N",
+                    help="Process files in N parallel processes (0: one per cpu). Default: %(default)s.")
+
+parser.add_argument("--cache", dest="cache_file", default=str(pathlib.Path.home()) + "/.cache/clean-source.json",
+                    metavar="FILE",
+                    help="Cache of processed files. Files unchanged since they were last processed with the same "
+                         "fixes are skipped. Default: %(default)s.")
+
+parser.add_argument("--no-cache", dest="no_cache", default=False, action="store_true",
+                    help="Neither use nor update the cache.")
+
+parser.add_argument("--exclude", dest="excludes", default=list(DEFAULT_EXCLUDES), action="append", metavar="GLOB",
+                    help="When recursing, skip files and directories whose name or relative path matches GLOB. "
+                         "Can be given multiple times. Always excluded: " + ", ".join(DEFAULT_EXCLUDES) + ".")
+
+parser.add_argument("--include", dest="includes", default=[], action="append", metavar="GLOB",
+                    help="When recursing, only process files whose name or relative path matches GLOB. "
+                         "Can be given multiple times.")
 
 # parser.add_argument("-c", "--codeline", default=default_codeline, metavar="CODELINE",
 #                    help="Codeline (repository) to build. Default: %(default)s. Valid values: %(choices)s.",
 #                    choices=valid_codelines)
 
 # positional args
-parser.add_argument("files", default=[], nargs='+', metavar="FILES",
+parser.add_argument("files", default=[], nargs='*', metavar="FILES",
                     help="Files to scanVariant(s) to build. Default: %(default)s. "
                          "Valid values: %(choices)s.")
 
 args = parser.parse_args()
+
+# With --check --format json, stdout is reserved for the json diagnostics; everything else goes to stderr.
+json_output = None
+if args.check and args.format == "json":
+    json_output = sys.stdout
+    sys.stdout = sys.stderr
+
 if args.is_verbose:
     trc(str(args))
 
 ################################################
-# first build up a list of files by resolving directories recursively.
+# first find the files to process by resolving directories recursively.
 # Also, we only deal with c/c++ files
 
 VALID_EXTENSIONS = ["cpp", "c", "hpp", "h"]
 
-files_to_process = []
-
 # First off, find out which files to process. All files are given on the command line,
-# unless --from-patch-file is given, in which case we expect the patch file to contain all
-# the files to modify (todo)
+# unless --from-patch-file, --git-diff or --staged is given, in which case we process the
+# hotspot files touched by the diff.
+# Directories are walked lazily, so that we start processing files right away.
 
 for f in args.files:
     if not os.path.exists(f):
         error_exit("File not found: " + f)
 
-    if os.path.isdir(f) and args.recursive:
-        files_to_process = files_to_process + find_files_to_process(f)
-    else:
-        if should_process_this_file(f):
-            files_to_process.append(f)
+selection_diff = read_selection_diff()
 
-for f in files_to_process:
+if selection_diff is None and len(args.files) == 0:
+    error_exit("No files given.")
 
-    verbose("Processing " + f + "...")
+if args.changed_lines_only and selection_diff is None:
+    error_exit("--changed-lines-only needs --from-patch-file, --git-diff or --staged.")
 
-    input_lines = []
-    success = True
 
-    # Read in file
-    with open(f) as file_in:
-        input_lines = file_in.readlines()
-        file_in.close()
+cache_entries = {} if args.no_cache else load_cache(args.cache_file)
+fixes = enabled_fixes()
+if args.check:
+    fixes = "check:" + fixes
 
-    verbose(str(len(input_lines)) + " lines read...")
 
-    output_lines = input_lines.copy()
+num_jobs = args.jobs if args.jobs > 0 else os.cpu_count()
 
-    # Mofidy ....
-    if args.fix_include_blocks or args.allall:
-        success &= fix_include_block(output_lines, is_source_file(f))
+if num_jobs > 1:
+    # Note: explicitly fork, since the workers rely on the parsed arguments of this process
+    pool = multiprocessing.get_context('fork').Pool(num_jobs)
+    results = process_in_batches(pool, work_items(selection_diff, fixes, cache_entries), num_jobs * 64)
+else:
+    pool = None
+    results = map(process_file_captured, work_items(selection_diff, fixes, cache_entries))
 
-    if args.squash_empty_lines or args.allall:
-        success &= squash_multiple_empty_lines(output_lines)
+num_violations = 0
+json_diagnostics = []
 
-    if args.fix_whitespaces or args.allall:
-        success &= fix_whitespaces(output_lines)
-
-    if args.fix_include_guards  or args.allall:
-        if is_header_file(f):
-            success &= fix_include_guards(output_lines, str(pathlib.Path(f).absolute()))
+# results come in the order the files were found
+for f, key, result, entry, diagnostics, output in results:
 
-    # do other stuff....
+    if not args.changed_lines_only:
+        cache_entries[key] = entry
+    print(output, end='')
 
-    # ignore files which feel iffy
-    if not success:
+    if result == "violations":
+        num_violations += len(diagnostics)
+        for d in diagnostics:
+            if args.format == "json":
+                json_diagnostics.append({'file': f, 'line': d[0], 'rule': d[1], 'message': d[2]})
+            else:
+                print(format_diagnostic(f, d))
+    elif result == "unclear":
         trc(f + ": unclear. Please fix manually.")
-        continue
-
-    # output: if any of the previous steps changed the file, and dry-run is not active,
-    # write out the changed file.
-    if input_lines != output_lines:
+    elif result == "changed":
         trc("Fixing " + f)
         if args.dry_run:
             trc(" (dry run. Nothing changed.)")
-        else:
-            with open(f, mode='w') as file_out:
-                file_out.writelines(output_lines)
+
+if pool is not None:
+    pool.close()
+    pool.join()
+
+if not args.no_cache:
+    save_cache(args.cache_file, cache_entries)
+
+if args.check:
+    if args.format == "json":
+        print(json.dumps(json_diagnostics, indent=2), file=json_output)
+    if num_violations > 0:
+        sys.exit(1)
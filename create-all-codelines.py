@@ -11,36 +11,34 @@ import argparse
 import os
 import shutil
 import subprocess
+import concurrent.futures
+import functools
+import time
+import re
+
+import bootjdks
+import registry
 
 def trc(text):
     print("--- " + text)
 
-# initialise a directory stack
-pushstack = list()
-
-def pushdir(dirname):
-    global pushstack
-    pushstack.append(os.getcwd())
-    verbose("-> " + dirname)
-    os.chdir(dirname)
-
 
-def popdir():
-    global pushstack
-    last_dir = pushstack.pop()
-    verbose("<- " + last_dir)
-    os.chdir(last_dir)
+class CommandFailed(Exception):
+    pass
 
 
-def run_command_and_return_stdout(command):
-    verbose('calling: ' + ' '.join(command))
+# Note: we never chdir, since provisioning tasks run concurrently; commands get their working dir as cwd.
+# Output (stdout and stderr) is captured; if the command fails, CommandFailed is raised, carrying the output.
+def run_command_and_return_stdout(command, cwd=None):
+    verbose('calling: ' + ' '.join(command) + ('' if cwd is None else ' (in ' + cwd + ')'))
     try:
-        stdout = subprocess.check_output(command)
+        stdout = subprocess.check_output(command, cwd=cwd, stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as e:
-        trc('Command failed ' + ' '.join(command))
-        print(e)
-        sys.exit('Sorry :-(')
-    stdout = stdout.decode("utf-8")
+        raise CommandFailed('Command failed (exit code ' + str(e.returncode) + '): ' + ' '.join(command) + '\n' +
+                            e.output.decode("utf-8", errors="replace"))
+    except OSError as e:
+        raise CommandFailed('Command failed: ' + ' '.join(command) + ': ' + str(e))
+    stdout = stdout.decode("utf-8", errors="replace")
     verbose('out: ' + stdout)
     return stdout
 
@@ -64,7 +62,87 @@ def delete_directory_safe(dir):
 
 openjdk_root = os.getcwd()
 gtest_dir = openjdk_root + "/gtest"
-bootjdk = "sapmachine16"
+
+
+#####################
+# Provisioning tasks. Every task has a function (no arguments), the names of the tasks it depends on, and
+# the resource it mainly uses, which limits how many tasks run at once:
+#  - "net":   clones and downloads; these run in parallel (--net-jobs)
+#  - "disk":  unpacking archives; disk heavy, so by default one at a time (--disk-jobs)
+#  - "local": quick local work like creating directories
+#  - "store": fetches into the shared git object store; git does not like concurrent fetches into the same
+#             repository, so one at a time
+#  - "configure": configure runs (--configure-jobs)
+# Tasks run in the order they were added, as soon as their dependencies are done and their resource allows.
+
+tasks = {}
+
+
+def add_task(name, function, depends_on=(), resource="local"):
+    for dependency in depends_on:
+        # this also guarantees we have no cycles
+        if dependency not in tasks:
+            error_exit("Task " + name + " depends on unknown task " + dependency)
+    tasks[name] = {'name': name, 'function': function, 'depends': list(depends_on), 'resource': resource}
+
+
+def resource_limits():
+    return {'net': max(1, args.net_jobs), 'disk': max(1, args.disk_jobs), 'local': 4, 'store': 1,
+            'configure': max(1, args.configure_jobs)}
+
+
+def format_progress(states, running, text):
+    num_finished = len([s for s in states.values() if s != "waiting" and s != "running"])
+    line = "[" + str(num_finished) + "/" + str(len(states)) + "] " + text
+    if len(running) > 0:
+        line += "; running: " + ", ".join(sorted(running.values()))
+    return line
+
+
+# Runs all tasks. Returns the final states of all tasks ("done", "failed" or "skipped") and a dict
+# task name -> error text for all failed tasks; tasks depending on failed tasks are skipped.
+# Tasks fail by raising an exception (preferably CommandFailed); a failed task never stops the other tasks.
+def run_tasks():
+    limits = resource_limits()
+    states = {name: "waiting" for name in tasks}
+    errors = {}
+    in_use = {resource: 0 for resource in limits}
+    running = {}
+    started = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sum(limits.values())) as executor:
+        while True:
+            # Dependencies are always added before their dependents, so a single pass in order is enough
+            # to propagate skips.
+            for name, task in tasks.items():
+                if states[name] != "waiting":
+                    continue
+                dependency_states = [states[d] for d in task['depends']]
+                if "failed" in dependency_states or "skipped" in dependency_states:
+                    states[name] = "skipped"
+                    trc(format_progress(states, running, "skipped: " + name))
+                elif all(s == "done" for s in dependency_states) and in_use[task['resource']] < limits[task['resource']]:
+                    in_use[task['resource']] += 1
+                    states[name] = "running"
+                    started[name] = time.time()
+                    running[executor.submit(task['function'])] = name
+                    verbose("started: " + name)
+            if len(running) == 0:
+                break
+            done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                in_use[tasks[name]['resource']] -= 1
+                seconds = " (" + "%.1fs" % (time.time() - started[name]) + ")"
+                try:
+                    future.result()
+                    states[name] = "done"
+                    trc(format_progress(states, running, "done: " + name + seconds))
+                except (Exception, SystemExit) as e:
+                    # (SystemExit: a task called error_exit; that must not end the other tasks)
+                    states[name] = "failed"
+                    errors[name] = str(e)
+                    trc(format_progress(states, running, "FAILED: " + name + seconds))
+    return states, errors
 
 
 def write_lines_to_file(lines, filename):
@@ -75,73 +153,87 @@ def write_lines_to_file(lines, filename):
     f.close()
 
 
-# call from within codeline dir
-def create_output_directory(output_configuration, configure_args):
-    output_dir_name = "output-" + output_configuration
-    pathlib.Path("output-" + output_configuration).mkdir(parents=False, exist_ok=True)
-
-
-# call from within codeline dir
-def create_output_directories():
-    option_bootjdk = "--with-boot-jdk=" + openjdk_root + "/jdks/" + bootjdk + " "
-    option_fastdebug = "--with-debug-level=fastdebug "
-    option_slowdebug = "--with-debug-level=slowdebug "
-    option_release = "--with-debug-level=release "
-    option_nopch = "--disable-precompiled-headers "
+# returns a list of [output dir name suffix, configure options]. The output dirs, their options and the boot
+# jdk come from the registry (see registry.py).
+def names_and_configure_lines(codeline_name):
+    option_bootjdk = "--with-boot-jdk=" + openjdk_root + "/jdks/" + provision_boot_jdk(codeline_name) + " "
     option_gtest = "--with-gtest=" + gtest_dir + "/googletest "
-    option_bit32 = "--with-target-bits=32 "
-    option_zero = "--with-jvm-variants=zero "
-    option_minimal = "--with-jvm-variants=minimal "
 
     standard_options = option_bootjdk + option_gtest
 
-    names_and_configure_lines = [
-        ["fastdebug",           standard_options + option_fastdebug + option_nopch],
-        ["slowdebug",           standard_options + option_slowdebug],
-        ["release",             standard_options + option_release + option_nopch],
-        ["fastdebug-32",        standard_options + option_fastdebug + option_bit32 + option_nopch],
-        ["fastdebug-zero",      standard_options + option_fastdebug + option_zero],
-        ["minimal",             standard_options + option_fastdebug + option_nopch + option_minimal],
-    ]
+    return [[name, standard_options + configure_options] for name, configure_options in registry.output_dirs().items()]
+
 
-    for x in names_and_configure_lines:
-        pathlib.Path("output-" + x[0]).mkdir(parents=False, exist_ok=True)
+def provision_boot_jdk(codeline_name):
+    return registry.codeline(codeline_name)['provision-boot-jdk']
 
-    # create a single bash to init all configure lines. Just runs configure in all output dirs.
+
+def create_output_directories(codeline_name, codeline_dir):
+    for x in names_and_configure_lines(codeline_name):
+        pathlib.Path(codeline_dir + "/output-" + x[0]).mkdir(parents=False, exist_ok=True)
+
+    # create a single bash to init all configure lines. Runs configure in all output dirs at once (at most
+    # MAX_JOBS at a time); every configure writes its output to output-<name>.configure.out next to its output
+    # dir (configure refuses to run in a non-empty output dir). Prints a pass/fail table at the end.
     lines = [
         "#!/bin/bash",
-        "set -e"
+        "",
+        "MAX_JOBS=${MAX_JOBS:-" + str(len(registry.output_dirs())) + "}",
+        "cd \"$(dirname \"$0\")\"",
+        "",
+        "run_configure() {",
+        "    local dir=$1",
+        "    shift",
+        "    rm -f $dir.configure.exitcode",
+        "    (cd $dir && bash ../source/configure \"$@\") > $dir.configure.out 2>&1",
+        "    echo $? > $dir.configure.exitcode",
+        "}",
+        "",
+        "dirs=()"
     ]
 
-    for x in names_and_configure_lines:
-        lines.append("pushd output-" + x[0])
-        lines.append("bash ../source/configure " + x[1])
-        lines.append("popd")
-
-    write_lines_to_file(lines, "run-all-configure.sh")
+    for x in names_and_configure_lines(codeline_name):
+        lines.append("while [ $(jobs -rp | wc -l) -ge $MAX_JOBS ]; do wait -n; done")
+        lines.append("echo \"configuring output-" + x[0] + "...\"")
+        lines.append("run_configure output-" + x[0] + " " + x[1] + " &")
+        lines.append("dirs+=(output-" + x[0] + ")")
+
+    lines.extend([
+        "wait",
+        "",
+        "failed=0",
+        "for dir in \"${dirs[@]}\"; do",
+        "    if [ \"$(cat $dir.configure.exitcode 2>/dev/null)\" = \"0\" ]; then",
+        "        printf \"%-25s OK\\n\" $dir",
+        "    else",
+        "        printf \"%-25s FAILED, see $dir.configure.out and $dir/config.log\\n\" $dir",
+        "        failed=1",
+        "    fi",
+        "done",
+        "exit $failed"
+    ])
+
+    write_lines_to_file(lines, codeline_dir + "/run-all-configure.sh")
 
 # Initialize a codeline directory (before getting the sources)
 def init_codeline_directory_1(codeline_name):
+    codeline_dir = openjdk_root + "/" + codeline_name
 
-    if args.clean and pathlib.Path(codeline_name).exists():
-        pushdir(codeline_name)
-        trc("Cleaning codeline dir...")
+    if args.clean and pathlib.Path(codeline_dir).exists():
+        trc("Cleaning codeline dir " + codeline_name + "...")
         # delete all but the existing source folder from the codeline dir:
-        to_delete = [f for f in os.listdir('.') if f != "source"]
+        to_delete = [f for f in os.listdir(codeline_dir) if f != "source"]
         for f in to_delete:
             trc("f" + f)
-            if pathlib.Path(f).is_dir():
-                delete_directory_safe(f)
+            if pathlib.Path(codeline_dir + "/" + f).is_dir():
+                delete_directory_safe(codeline_dir + "/" + f)
             else:
-                os.remove(f)
-        popdir()
+                os.remove(codeline_dir + "/" + f)
 
     # Create directory and output directories
-    pathlib.Path(codeline_name).mkdir(parents=False, exist_ok=True)
-
-    pushdir(codeline_name)
+    pathlib.Path(codeline_dir).mkdir(parents=False, exist_ok=True)
 
-    create_output_directories()
+    create_output_directories(codeline_name, codeline_dir)
 
     # put down a script to prepare the intellij workspace (see
     # https://github.com/tstuefe/docs/blob/master/intellij-ojdk-setup.md)
@@ -155,65 +247,159 @@ def init_codeline_directory_1(codeline_name):
         ". /shared/projects/ant/setenv.sh",
         "bash ./bin/idea.sh",
         "popd"
-    ], "intellij_init.sh")
+    ], codeline_dir + "/intellij_init.sh")
 
-    # Also create the CDT workspace. We give it a good name since the name shows up in
-    #  Eclipse and helps telling apart running cdt instances
+
+# Also create the CDT workspace. We give it a good name since the name shows up in
+#  Eclipse and helps telling apart running cdt instances
+def clone_cdt_workspace(codeline_name):
     cdt_workspace_dir = "cdt-ws-" + codeline_name
-    if pathlib.Path(cdt_workspace_dir).exists():
+    if pathlib.Path(openjdk_root + "/" + codeline_name + "/" + cdt_workspace_dir).exists():
         trc(cdt_workspace_dir + " found, skipping.")
     else:
-        run_command_and_return_stdout(["git", "clone", "git@github.com:tstuefe/ojdk-cdt.git", cdt_workspace_dir])
+        run_command_and_return_stdout(["git", "clone", "git@github.com:tstuefe/ojdk-cdt.git", cdt_workspace_dir],
+                                      cwd=openjdk_root + "/" + codeline_name)
+
+
+# Adds the tasks for a codeline: initialize the directory, then get the sources (the function given; it may
+# depend on more tasks) and the CDT workspace. The sources come first since they take longest.
+def add_codeline_tasks(codeline_name, get_source_function, source_depends_on=()):
+    init_task = "init " + codeline_name
+    add_task(init_task, functools.partial(init_codeline_directory_1, codeline_name))
+    add_task("source " + codeline_name, get_source_function, depends_on=[init_task] + list(source_depends_on),
+             resource="net")
+    add_task("cdt " + codeline_name, functools.partial(clone_cdt_workspace, codeline_name),
+             depends_on=[init_task], resource="net")
+    if args.run_configure:
+        # configure needs the boot jdk and gtest, if we are getting them in this run
+        boot_jdk = provision_boot_jdk(codeline_name)
+        depends_on = ["source " + codeline_name] + [t for t in ["unpack " + boot_jdk, "gtest"] if t in tasks]
+        for name, configure_line in names_and_configure_lines(codeline_name):
+            add_task("configure " + codeline_name + " " + name,
+                     functools.partial(run_configure, codeline_name, name, configure_line),
+                     depends_on=depends_on, resource="configure")
+
+
+# Runs configure in an output dir. Like run-all-configure.sh, writes the output to output-<name>.configure.out
+# next to the output dir.
+def run_configure(codeline_name, name, configure_line):
+    output_dir = openjdk_root + "/" + codeline_name + "/output-" + name
+    command = ["bash", "../source/configure"] + configure_line.split()
+    verbose('calling: ' + ' '.join(command) + ' (in ' + output_dir + ')')
+    with open(output_dir + ".configure.out", mode='w') as out:
+        exit_code = subprocess.run(command, cwd=output_dir, stdout=out, stderr=subprocess.STDOUT).returncode
+    if exit_code != 0:
+        raise CommandFailed("configure failed (exit code " + str(exit_code) + "), see " + output_dir +
+                            ".configure.out and " + output_dir + "/config.log")
+
+
+def print_configure_results(states):
+    trc("Configure results:")
+    for name, state in states.items():
+        if name.startswith("configure "):
+            print(name[len("configure "):].ljust(40) + " " + {"done": "OK"}.get(state, state.upper()))
+
+
+#####################
+# The shared git object store (--git-mode reference|worktree): one local bare repository, with one remote per
+# repository url, which all codeline sources take their objects from. The codelines share most of their
+# history, so this saves most of the disk space and download time.
+#  - reference: codeline sources are clones using the store as reference (git clone --reference). They still
+#               talk to their origin, but only download what is not in the store.
+#  - worktree:  codeline sources are worktrees of the store, on a branch named like the codeline.
+# Note: the store must not be deleted (or pruned with gc) as long as codeline sources use it.
+
+def object_store_dir():
+    return str(pathlib.Path(args.object_store).absolute())
+
+
+def remote_name_for_url(git_url):
+    return re.sub(r'[^A-Za-z0-9]+', '-', git_url).strip('-')
+
+
+def init_object_store():
+    if not pathlib.Path(object_store_dir()).exists():
+        run_command_and_return_stdout(["git", "init", "--bare", "-q", object_store_dir()])
+
+
+# Fetch a branch of the given repository into the store
+def fetch_into_object_store(git_url, git_branch):
+    remote = remote_name_for_url(git_url)
+    remotes = run_command_and_return_stdout(["git", "remote"], cwd=object_store_dir()).split()
+    if remote not in remotes:
+        run_command_and_return_stdout(["git", "remote", "add", remote, git_url], cwd=object_store_dir())
+    run_command_and_return_stdout(["git", "fetch", "-q", remote,
+                                   "+refs/heads/" + git_branch + ":refs/remotes/" + remote + "/" + git_branch],
+                                  cwd=object_store_dir())
+
+
+def clone_git_source(codeline_name, git_url, git_branch):
+    codeline_dir = openjdk_root + "/" + codeline_name
+    if pathlib.Path(codeline_dir + "/source").exists():
+        return
+    if args.git_mode == "worktree":
+        run_command_and_return_stdout(["git", "worktree", "add", "-q", "-B", codeline_name, codeline_dir + "/source",
+                                       remote_name_for_url(git_url) + "/" + git_branch], cwd=object_store_dir())
+        return
+    if args.git_mode == "reference":
+        run_command_and_return_stdout(["git", "clone", "--reference", object_store_dir(), git_url, "source"],
+                                      cwd=codeline_dir)
+    else:
+        run_command_and_return_stdout(["git", "clone", git_url, "source"], cwd=codeline_dir)
+    run_command_and_return_stdout(["git", "checkout", git_branch], cwd=codeline_dir + "/source")
 
-    popdir()
+
+def clone_mercurial_source(codeline_name, hg_url, is_forest):
+    codeline_dir = openjdk_root + "/" + codeline_name
+    if not pathlib.Path(codeline_dir + "/source").exists():
+        run_command_and_return_stdout(["hg", "clone", hg_url, "source"], cwd=codeline_dir)
+        if is_forest:
+            run_command_and_return_stdout(["bash", "get_source.sh"], cwd=codeline_dir + "/source")
 
 
-# call from within opendjk root dir
 def create_codeline_directory_from_git(codeline_name, git_url, git_branch):
-    init_codeline_directory_1(codeline_name)
-    pushdir(codeline_name)
-    if not pathlib.Path("source").exists():
-        run_command_and_return_stdout(["git", "clone", git_url, "source"])
-        pushdir("source")
-        run_command_and_return_stdout(["git", "checkout", git_branch])
-        popdir()
-    popdir()
+    source_depends_on = []
+    if args.git_mode != "clone" and not pathlib.Path(openjdk_root + "/" + codeline_name + "/source").exists():
+        if "init store" not in tasks:
+            add_task("init store", init_object_store)
+        fetch_task = "fetch " + remote_name_for_url(git_url) + " " + git_branch
+        if fetch_task not in tasks:
+            add_task(fetch_task, functools.partial(fetch_into_object_store, git_url, git_branch),
+                     depends_on=["init store"], resource="store")
+        source_depends_on.append(fetch_task)
+    add_codeline_tasks(codeline_name, functools.partial(clone_git_source, codeline_name, git_url, git_branch),
+                       source_depends_on)
 
 
 # JDKs in a unified mercurial repo
 def create_codeline_directory_from_mercurial_unified(codeline_name, hg_url):
-    init_codeline_directory_1(codeline_name)
-    pushdir(codeline_name)
-    if not pathlib.Path("source").exists():
-        run_command_and_return_stdout(["hg", "clone", hg_url, "source"])
-    popdir()
+    add_codeline_tasks(codeline_name, functools.partial(clone_mercurial_source, codeline_name, hg_url, False))
 
 # JDKs in a forest repo
 def create_codeline_directory_from_mercurial_forest(codeline_name, hg_url):
-    init_codeline_directory_1(codeline_name)
-    pushdir(codeline_name)
-    if not pathlib.Path("source").exists():
-        run_command_and_return_stdout(["hg", "clone", hg_url, "source"])
-        pushdir("source")
-        run_command_and_return_stdout(["bash", "get_source.sh"])
-        popdir()
-    popdir()
+    add_codeline_tasks(codeline_name, functools.partial(clone_mercurial_source, codeline_name, hg_url, True))
 
 
+# Boot JDKs come from the manifest (bootjdks.json): downloaded into the shared archive cache, unpacked there
+# (once per archive), and linked into jdks/. See bootjdks.py.
 def create_jdks_directory_if_needed():
-    pathlib.Path("jdks").mkdir(parents=False, exist_ok=True)
-    pushdir("jdks")
-    if pathlib.Path("sapmachine11").exists():
-        trc("jdks/sapmachine11 found, skipping.")
-    else:
-        run_command_and_return_stdout(["wget", "https://github.com/SAP/SapMachine/releases/download/sapmachine-11.0.8/sapmachine-jdk-11.0.8_linux-x64_bin.tar.gz"])
-        run_command_and_return_stdout(["tar", "--one-top-level=sapmachine11", "--strip-components=1", "-xf", "sapmachine-jdk-11.0.8_linux-x64_bin.tar.gz"])
-    if pathlib.Path("sapmachine15").exists():
-        trc("jdks/sapmachine15 found, skipping.")
-    else:
-        run_command_and_return_stdout(["wget", "https://github.com/SAP/SapMachine/releases/download/sapmachine-15/sapmachine-jdk-15_linux-x64_bin.tar.gz"])
-        run_command_and_return_stdout(["tar", "--one-top-level=sapmachine15", "--strip-components=1", "-xf", "sapmachine-jdk-15_linux-x64_bin.tar.gz"])
-    popdir()
+    pathlib.Path(openjdk_root + "/jdks").mkdir(parents=False, exist_ok=True)
+    try:
+        manifest = bootjdks.load_manifest(args.jdk_manifest)
+    except bootjdks.BootJdkError as e:
+        error_exit(str(e))
+    for jdk_name, entry in manifest.items():
+        if pathlib.Path(openjdk_root + "/jdks/" + jdk_name).exists():
+            trc("jdks/" + jdk_name + " found, skipping.")
+        elif entry.get('url') is None:
+            trc("jdks/" + jdk_name + " missing. " + entry.get('note', "Please install it manually."))
+        else:
+            add_task("download " + jdk_name, functools.partial(bootjdks.download_archive, entry, args.jdk_cache,
+                                                               args.allow_unverified_jdks),
+                     resource="net")
+            add_task("unpack " + jdk_name, functools.partial(bootjdks.install_jdk, jdk_name, entry,
+                                                             openjdk_root + "/jdks", args.jdk_cache),
+                     depends_on=["download " + jdk_name], resource="disk")
 
 
 ########################################
@@ -226,10 +412,44 @@ parser.add_argument("-v", "--verbose", dest="is_verbose", default=False,
 parser.add_argument("-c", "--clean", dest="clean", default=False,
                     help="Clear old codeline dirs from all but the sources themselves", action="store_true")
 
+parser.add_argument("--net-jobs", dest="net_jobs", default=4, type=int,
+                    help="Number of clones and downloads to run at once. Default: %(default)s.")
+
+parser.add_argument("--disk-jobs", dest="disk_jobs", default=1, type=int,
+                    help="Number of archives to unpack at once. Default: %(default)s.")
+
+parser.add_argument("--run-configure", dest="run_configure", default=False, action="store_true",
+                    help="Run configure in all output dirs of all codelines, once their sources are there.")
+
+parser.add_argument("--configure-jobs", dest="configure_jobs", default=os.cpu_count() or 1, type=int,
+                    help="Number of configure runs at once. Default: %(default)s.")
+
+parser.add_argument("--jdk-cache", dest="jdk_cache", default=bootjdks.default_cache_dir(), metavar="DIR",
+                    help="Cache for boot jdk archives and unpacked boot jdks, shared by all openjdk roots. "
+                         "Default: %(default)s.")
+
+parser.add_argument("--jdk-manifest", dest="jdk_manifest", default=bootjdks.MANIFEST_FILE, metavar="FILE",
+                    help="Boot jdk manifest. Default: %(default)s.")
+
+parser.add_argument("--allow-unverified-jdks", dest="allow_unverified_jdks", default=False, action="store_true",
+                    help="Download boot jdks even if the manifest has no sha256 or sha256-url to verify them "
+                         "with. By default, these are refused.")
+
+parser.add_argument("--git-mode", dest="git_mode", default="clone", choices=["clone", "reference", "worktree"],
+                    help="How to get git codeline sources. clone: a full clone per codeline. reference: clones "
+                         "taking their objects from a shared local object store (git clone --reference). "
+                         "worktree: worktrees of the shared object store. Default: %(default)s.")
+
+parser.add_argument("--object-store", dest="object_store", default="git-objects.git", metavar="DIR",
+                    help="The shared git object store (a bare repository) for --git-mode reference|worktree. "
+                         "Default: %(default)s in the openjdk root dir.")
+
 args = parser.parse_args()
 if args.is_verbose:
     trc(str(args))
 
+args.jdk_cache = str(pathlib.Path(args.jdk_cache).absolute())
+
 cwd = os.getcwd()
 if not cwd.endswith("openjdk"):
     sys.exit('Call from openjdk root dir');
@@ -241,19 +461,27 @@ create_jdks_directory_if_needed()
 
 # if gtest suite is missing, get it
 if not pathlib.Path(gtest_dir).exists():
-    run_command_and_return_stdout(["git", "clone", "git@github.com:tstuefe/ojdk-gtest.git", "gtest"])
-
-create_codeline_directory_from_git("jdk-jdk",           "git@github.com:tstuefe/jdk.git", "master")
+    add_task("gtest", functools.partial(run_command_and_return_stdout,
+                                        ["git", "clone", "git@github.com:tstuefe/ojdk-gtest.git", "gtest"], openjdk_root),
+             resource="net")
 
-# sapmachine: all releases are branches within that one repo
-create_codeline_directory_from_git("sapmachine",   "git@github.com:tstuefe/SapMachine.git", "sapmachine")
+# The codelines and their repositories are in the registry (registry.json, "provision").
+# Notes: sapmachine: all releases are branches within that one repo; jdk-jdk8u is my personal fork, includes vitals
+for provisioned_codeline in registry.provisioned_codelines():
+    codeline_attributes = registry.codeline(provisioned_codeline)
+    create_codeline_directory_from_git(provisioned_codeline, codeline_attributes['git-url'],
+                                       codeline_attributes['git-branch'])
 
-
-create_codeline_directory_from_git("jdk-jdk11u-dev", "git@github.com:tstuefe/jdk11u-dev.git", "master")
 #create_codeline_directory_from_mercurial_unified("jdk-jdk11u-dev", "http://hg.openjdk.java.net/jdk-updates/jdk11u-dev/")
 
-# my personal fork, includes vitals
-create_codeline_directory_from_git("jdk-jdk8u", "git@github.com:tstuefe/jdk8u.git", "master")
-
 #create_codeline_directory_from_mercurial_forest("jdk-jdk8u-dev", "http://hg.openjdk.java.net/jdk8u/jdk8u-dev/")
 
+#####################################
+
+task_states, failed_tasks = run_tasks()
+if args.run_configure:
+    print_configure_results(task_states)
+if len(failed_tasks) > 0:
+    for task_name, error in failed_tasks.items():
+        print('*** ERROR: ' + task_name + ': ' + error)
+    sys.exit('Sorry :-(')
@@ -0,0 +1,330 @@
+# !/usr/bin/env python3
+
+# Maintains an index of the #include dependencies between hotspot files, and answers questions like
+# "which translation units are rebuilt if I change this header?".
+#
+# include-graph.py [options] update
+# include-graph.py [options] impact <header>...
+# include-graph.py [options] rank
+
+
+import pathlib
+import sys
+import os
+import argparse
+import json
+import re
+
+
+def trc(text):
+    print("--- " + text)
+
+
+def error_exit(text):
+    print('*** ERROR: ' + text)
+    sys.exit(':-(')
+
+
+def verbose(text):
+    if args.is_verbose:
+        print("--- " + text)
+
+
+def has_extension(filename, extensions):
+    extension = pathlib.Path(filename).suffix
+    if extension in extensions:
+        return True
+    else:
+        return False
+
+
+def is_source_file(filename):
+    return has_extension(filename, {".cpp", ".c"})
+
+
+def is_header_file(filename):
+    return has_extension(filename, {".hpp", ".h"})
+
+
+def should_process_this_file(filename):
+    return is_source_file(filename) or is_header_file(filename)
+
+
+#####################
+# The index: for every file under src/hotspot (path relative to src/hotspot), its size, mtime and the
+# names of the files it includes (as written in the #include directives; resolving them is platform
+# dependent and done when we load the index). Only files which changed since the last run are read again.
+
+# bump whenever the index format or the parsing changes
+INDEX_VERSION = 1
+
+include_regex = re.compile(r'^\s*#\s*include\s+(?:"([^"]+)"|([A-Z_]+_HEADER(?:_INLINE)?)\((\w+)\))')
+
+
+# returns the list of includes of a file. Includes via the platform macros (CPU_HEADER(x) etc) are
+# returned as "MACRO(x)".
+def parse_includes(full_path):
+    includes = []
+    with open(full_path, errors='replace') as f:
+        for line in f:
+            if '#' not in line:
+                continue
+            m = include_regex.match(line)
+            if m is None:
+                continue
+            if m.group(1) is not None:
+                includes.append(m.group(1))
+            else:
+                includes.append(m.group(2) + "(" + m.group(3) + ")")
+    return includes
+
+
+# yields (path relative to hotspot_dir, os.stat_result) for all source files
+def walk_hotspot_dir(directory, relative_dir=""):
+    with os.scandir(directory) as it:
+        for entry in it:
+            relative_path = relative_dir + entry.name
+            if entry.is_dir():
+                yield from walk_hotspot_dir(entry.path, relative_path + "/")
+            elif should_process_this_file(entry.name):
+                yield relative_path, entry.stat()
+
+
+def load_index(index_file, hotspot_dir):
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and index.get('root') == hotspot_dir:
+            return index['files']
+        verbose("Ignoring outdated index " + index_file)
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_index(index_file, hotspot_dir, files):
+    pathlib.Path(index_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, mode='w') as f:
+        json.dump({'version': INDEX_VERSION, 'root': hotspot_dir, 'files': files}, f)
+    os.replace(tmp_file, index_file)
+
+
+# Bring the index up to date with the files on disk. Returns the updated file entries.
+def update_index(old_files, hotspot_dir):
+    files = {}
+    num_parsed = 0
+    for relative_path, st in walk_hotspot_dir(hotspot_dir):
+        old = old_files.get(relative_path)
+        if old is not None and old['size'] == st.st_size and old['mtime'] == st.st_mtime_ns:
+            files[relative_path] = old
+        else:
+            files[relative_path] = {'size': st.st_size, 'mtime': st.st_mtime_ns,
+                                    'includes': parse_includes(hotspot_dir + "/" + relative_path)}
+            num_parsed += 1
+    verbose(str(len(files)) + " files in index, " + str(num_parsed) + " (re)parsed, " +
+            str(len(set(old_files) - set(files))) + " removed.")
+    return files
+
+
+#####################
+# The include graph for one platform
+
+# the macros hotspot uses to include platform specific headers
+def expand_platform_macro(macro, name):
+    suffixes = {
+        'CPU_HEADER': "_" + args.cpu + ".hpp",
+        'CPU_HEADER_INLINE': "_" + args.cpu + ".inline.hpp",
+        'OS_HEADER': "_" + args.os + ".hpp",
+        'OS_HEADER_INLINE': "_" + args.os + ".inline.hpp",
+        'OS_CPU_HEADER': "_" + args.os + "_" + args.cpu + ".hpp",
+        'OS_CPU_HEADER_INLINE': "_" + args.os + "_" + args.cpu + ".inline.hpp",
+    }
+    if macro not in suffixes:
+        return None
+    return name + suffixes[macro]
+
+
+# the directories the hotspot build passes as include directories (-I), in order; relative to src/hotspot
+# (see make/hotspot/lib/JvmFlags.gmk). share/include and os/<os type>/include hold jvm.h and jvm_md.h.
+def include_directories():
+    os_type = "windows" if args.os == "windows" else "posix"
+    return ["share", "os/" + args.os, "os/" + os_type, "cpu/" + args.cpu, "os_cpu/" + args.os + "_" + args.cpu,
+            "share/precompiled", "share/include", "os/" + os_type + "/include"]
+
+
+# is this file part of the build for our platform?
+def is_platform_file(relative_path):
+    for directory in include_directories():
+        if relative_path.startswith(directory + "/"):
+            return True
+    return False
+
+
+# Build the graph from the index: returns (includes, included_by), both dicts mapping a file to the set of
+# files it includes resp. is included by. Files are paths relative to src/hotspot.
+def build_graph(files):
+    # For every include directory, map "path relative to the include directory" -> file
+    by_include_name = {}
+    for directory in reversed(include_directories()):
+        prefix = directory + "/"
+        for relative_path in files:
+            if relative_path.startswith(prefix):
+                by_include_name[relative_path[len(prefix):]] = relative_path
+
+    includes = {}
+    included_by = {}
+    num_unresolved = 0
+    for relative_path, entry in files.items():
+        if not is_platform_file(relative_path):
+            continue
+        if args.no_pch and relative_path.endswith("/precompiled.hpp"):
+            # without precompiled headers, precompiled.hpp includes nothing
+            includes[relative_path] = set()
+            continue
+        own_dir = os.path.dirname(relative_path) + "/"
+        resolved = set()
+        for include in entry['includes']:
+            if include.endswith(")"):
+                macro, name = include[:-1].split("(")
+                include = expand_platform_macro(macro, name)
+                if include is None:
+                    continue
+            # like the compiler, look into the directory of the including file first
+            target = own_dir + include if own_dir + include in files else by_include_name.get(include)
+            if target is None:
+                # generated or system headers
+                num_unresolved += 1
+                continue
+            resolved.add(target)
+            included_by.setdefault(target, set()).add(relative_path)
+        includes[relative_path] = resolved
+    verbose(str(num_unresolved) + " includes not found in the source tree (generated or system headers).")
+    return includes, included_by
+
+
+# returns the set of files (transitively) including the given file
+def transitive_includers(graph, start):
+    seen = set()
+    todo = [start]
+    while todo:
+        f = todo.pop()
+        for includer in graph.get(f, ()):
+            if includer not in seen:
+                seen.add(includer)
+                todo.append(includer)
+    return seen
+
+
+# given a header as passed on the command line, find it in the index
+def find_header(files, name):
+    name = str(pathlib.Path(name).absolute()) if os.path.exists(name) else name
+    if name.startswith(hotspot_dir + "/"):
+        name = name[len(hotspot_dir) + 1:]
+    if name in files:
+        return name
+    for directory in include_directories():
+        if directory + "/" + name in files:
+            return directory + "/" + name
+    error_exit("Cannot find " + name + " under " + hotspot_dir + ".")
+
+
+def object_name(relative_path):
+    return pathlib.Path(relative_path).stem + ".o"
+
+
+def print_impact(files, included_by, headers):
+    affected = set()
+    for header in headers:
+        relative_path = find_header(files, header)
+        tus = {f for f in transitive_includers(included_by, relative_path) if is_source_file(f)}
+        if is_source_file(relative_path):
+            tus.add(relative_path)
+        trc(relative_path + ": " + str(len(tus)) + " translation units affected.")
+        affected |= tus
+    if len(headers) > 1:
+        trc("Together: " + str(len(affected)) + " translation units affected.")
+    for f in sorted(affected):
+        print(object_name(f) if args.objects else "src/hotspot/" + f)
+
+
+# Rank headers by transitive fan-in, i.e. by the number of translation units including them
+def print_rank(includes):
+    fan_in = {}
+    tus = [f for f in includes if is_source_file(f)]
+    for tu in tus:
+        seen = set()
+        todo = [tu]
+        while todo:
+            f = todo.pop()
+            for included in includes.get(f, ()):
+                if included not in seen:
+                    seen.add(included)
+                    todo.append(included)
+        for header in seen:
+            fan_in[header] = fan_in.get(header, 0) + 1
+    trc(str(len(tus)) + " translation units, " + str(len(fan_in)) + " headers included.")
+    for header, count in sorted(fan_in.items(), key=lambda x: (-x[1], x[0]))[:args.num]:
+        print(str(count).rjust(6) + "  src/hotspot/" + header)
+
+
+#####################
+
+parser = argparse.ArgumentParser(description='Index hotspot include dependencies and estimate rebuild impact.')
+
+parser.add_argument("-v", "--verbose", dest="is_verbose", default=False,
+                    help="Debug output", action="store_true")
+
+parser.add_argument("-s", "--source", dest="source", default=".", metavar="DIR",
+                    help="Root of the jdk source tree. Default: current directory.")
+
+parser.add_argument("--index", dest="index_file", default=None, metavar="FILE",
+                    help="Index file. Default: one per source tree, in ~/.cache/include-graph.")
+
+parser.add_argument("--os", dest="os", default="linux",
+                    help="Operating system to resolve platform headers for. Default: %(default)s.")
+
+parser.add_argument("--cpu", dest="cpu", default="x86",
+                    help="CPU to resolve platform headers for. Default: %(default)s.")
+
+parser.add_argument("--no-pch", dest="no_pch", default=False, action="store_true",
+                    help="Assume a build without precompiled headers. Otherwise, every header included by "
+                         "precompiled.hpp affects every translation unit.")
+
+parser.add_argument("--objects", dest="objects", default=False, action="store_true",
+                    help="impact: print object file names instead of source file names.")
+
+parser.add_argument("-n", "--num", dest="num", default=30, type=int,
+                    help="rank: number of headers to show. Default: %(default)s.")
+
+# positional args
+parser.add_argument("command", choices=["update", "impact", "rank"],
+                    help="update: just update the index. impact: list the translation units rebuilt if the given "
+                         "headers change. rank: list the headers with the highest transitive fan-in.")
+
+parser.add_argument("headers", default=[], nargs='*', metavar="HEADER",
+                    help="impact: headers, as path or as include name (e.g. runtime/os.hpp).")
+
+args = parser.parse_intermixed_args()
+if args.is_verbose:
+    trc(str(args))
+
+hotspot_dir = str(pathlib.Path(args.source).absolute() / "src" / "hotspot")
+if not pathlib.Path(hotspot_dir).is_dir():
+    error_exit("Cannot find " + hotspot_dir + ".")
+
+if args.index_file is None:
+    args.index_file = str(pathlib.Path.home()) + "/.cache/include-graph/" + hotspot_dir.strip("/").replace("/", "_") + ".json"
+
+if args.command == "impact" and len(args.headers) == 0:
+    error_exit("impact: no headers given.")
+
+index_files = update_index(load_index(args.index_file, hotspot_dir), hotspot_dir)
+save_index(args.index_file, hotspot_dir, index_files)
+
+if args.command == "impact":
+    graph_includes, graph_included_by = build_graph(index_files)
+    print_impact(index_files, graph_included_by, args.headers)
+elif args.command == "rank":
+    graph_includes, graph_included_by = build_graph(index_files)
+    print_rank(graph_includes)
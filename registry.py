@@ -0,0 +1,98 @@
+# Codelines, build variants and variant combos, shared by run_builds.py and create-all-codelines.py.
+#
+# They are defined in registry.json (next to this file):
+#   codelines:        name -> boot-jdk, hgforest, and for codelines create-all-codelines.py sets up,
+#                     git-url, git-branch and provision-boot-jdk (the boot jdk it configures the output
+#                     dirs with)
+#   variants:         name -> configure options
+#   combos:           shorthand name -> list of variants
+#   default-variants: the combo built if no variants are given
+#   output-dirs:      name -> configure options of the output dirs create-all-codelines.py creates; these
+#                     are not the variants run_builds.py builds
+#   provision:        the codelines create-all-codelines.py sets up, in order
+#
+# The registry is loaded once; all lookups are by name.
+
+
+import pathlib
+import json
+
+
+REGISTRY_FILE = str(pathlib.Path(__file__).parent / "registry.json")
+
+
+class RegistryError(Exception):
+    pass
+
+
+_registry = None
+
+
+def load(registry_file=REGISTRY_FILE):
+    global _registry
+    if _registry is None:
+        try:
+            with open(registry_file) as f:
+                _registry = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RegistryError("Cannot read registry " + registry_file + ": " + str(e))
+    return _registry
+
+
+def codeline_names():
+    return list(load()['codelines'])
+
+
+# returns the attributes of the codeline, or None if there is no such codeline
+def codeline(name):
+    return load()['codelines'].get(name)
+
+
+def variant_names():
+    return list(load()['variants'])
+
+
+# returns the attributes of the variant, or None if there is no such variant
+def variant(name):
+    return load()['variants'].get(name)
+
+
+def combo_names():
+    return list(load()['combos'])
+
+
+# the name of the combo built if no variants are given
+def default_combo():
+    return load()['default-variants']
+
+
+# output dir name -> configure options, for create-all-codelines.py
+def output_dirs():
+    return load()['output-dirs']
+
+
+def provisioned_codelines():
+    return load()['provision']
+
+
+# given a list of variant names which may contain combos, return a list with all combos replaced by their
+# content, without duplicates
+def resolve_variants(names):
+    result = []
+    for name in names:
+        for variant_name in load()['combos'].get(name, [name]):
+            if variant(variant_name) is None:
+                raise RegistryError("Unknown variant " + variant_name + ".")
+            if variant_name not in result:
+                result.append(variant_name)
+    return result
+
+
+# Expands codelines x variants (which may contain combos) x targets into a list of
+# (codeline, variant, target) tuples, ordered by codeline, then variant, then target.
+def expand_matrix(codelines, variants, targets):
+    for name in codelines:
+        if codeline(name) is None:
+            raise RegistryError("Unknown codeline " + name + ".")
+    resolved_variants = resolve_variants(variants)
+    return [(c, v, t) for c in codelines for v in resolved_variants for t in targets]
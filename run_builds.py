@@ -6,188 +6,396 @@ import sys
 import os
 import argparse
 import subprocess
+import concurrent.futures
+import hashlib
+import json
+import collections
+import time
+import re
+import sqlite3
+import socket
+import statistics
+import threading
+import queue
+
+import bootjdks
+import registry
 
 # build one or more
 
 # run_builds [options] all|default|release+fastdebug+slowdebug+nopch+zero
-# [options]  -c codeline
+# [options]  -c codeline (several times for a build matrix of codelines x variants)
 #            -i incremental build
 
 ojdk_root = '/shared/projects/openjdk'
 
 
-def codeline_root():
-    return ojdk_root + '/' + args.codeline
+def codeline_root(codeline):
+    return ojdk_root + '/' + codeline
 
 
-def output_dir_for_variant(variant):
-    return codeline_root() + '/output-' + variant
+def output_dir_for_variant(codeline, variant):
+    return codeline_root(codeline) + '/output-' + variant
 
 
-def source_dir():
-    return codeline_root() + '/source'
+def source_dir(codeline):
+    return codeline_root(codeline) + '/source'
 
 
-# define codelines and their attributes
-codelines_and_attributes = (
-    # [ <codeline name>, <boot jdk to use>, <needs hgforest> ]
-    ('jdk-jdk', 'sapmachine15', False),
-    ('jdk-sandbox', 'sapmachine15', False),
-    ('jdk-jep387', 'sapmachine15', False),
-    ('jdk-sandbox-default', 'sapmachine15', False),
-    ('jdk-submit', 'sapmachine15', False),
-    ('jdk-updates-jdk11u-dev', 'sapmachine11', False),
-    ('jdk-updates-jdk11u', 'sapmachine11', False),
-    ('jdk-jdk8u', 'oraclejdk8', True),
-    ('sapmachine-head', 'sapmachine15', False),
-    ('sapmachine-12', 'sapmachine11', False),
-    ('sapmachine-11', 'sapmachine11', False),
-)
+# Codelines, build variants and variant combos are defined in registry.json, see registry.py.
 
 
-def valid_codelines():
-    result = []
-    for x in codelines_and_attributes:
-        result.append(x[0])
-    return result
+def trc(text):
+    print("--- " + text)
 
 
-def codeline_data_by_name(name: str) -> list:
-    for x in codelines_and_attributes:
-        if x[0] == name:
-            return x
-    return None
+def verbose(text):
+    if args.is_verbose:
+        print("--- " + text)
 
 
-# define build variants and their attributes
-build_variants_and_attributes = (
-    # <name>, <configure options>
-    ('slowdebug', '--with-debug-level=slowdebug'),
-    ('fastdebug', '--with-debug-level=fastdebug'),
-    ('fastdebug-nopch', '--with-debug-level=fastdebug --disable-precompiled-headers'),
-    ('fastdebug-zero', '--with-debug-level=fastdebug --with-jvm-variants=zero'),
-    ('release', '--with-debug-level=release'),
-)
+# Raised by build steps and source updates. They must not exit the script, since other variants may still be
+# building (or other codelines updating) in parallel.
+# steps: the step records (see run_build_step) of the variant build up to and including the failed step
+class BuildError(Exception):
+    def __init__(self, text, steps=None):
+        super().__init__(text)
+        self.steps = steps if steps is not None else []
 
 
-def valid_build_variants() -> tuple:
-    result = []
-    for x in build_variants_and_attributes:
-        result.append(x[0])
-    return result
+# Raises BuildError if the command fails
+def run_command_and_return_stdout(command, cwd=None):
+    verbose('calling: ' + ' '.join(command) + ('' if cwd is None else ' (in ' + cwd + ')'))
+    try:
+        stdout = subprocess.check_output(command, cwd=cwd)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise BuildError('Command failed ' + ' '.join(command) + ('' if cwd is None else ' (in ' + cwd + ')') +
+                         ': ' + str(e))
+    stdout = stdout.decode("utf-8")
+    verbose('out: ' + stdout)
+    return stdout
 
 
-def variant_data_by_name(name: str) -> list:
-    for x in build_variants_and_attributes:
-        if x[0] == name:
-            return x
-    return None
+# Identifies this invocation of run_builds.py. Used to name the build logs.
+run_id = time.strftime('%Y%m%d-%H%M%S')
 
 
-# a build variant combination is a set of build variants, with a shorthand moniker
-build_variant_combos = (
-    # name, [ array of build variants ]
-    ('some', ['release', 'fastdebug', 'slowdebug']),
-    ('all', valid_build_variants())
-)
+# The build logs of a variant live next to its output dir, not in it: configure refuses to run in a non-empty
+# output dir without spec.gmk.
+def build_log_dir(codeline, variant):
+    return codeline_root(codeline) + '/build-logs/' + variant
 
 
-def valid_build_variant_combos():
-    result = []
-    for x in build_variant_combos:
-        result.append(x[0])
-    return result
-
-
-# function takes a name of a build variant combos and returns a list of its build variants
-def resolve_build_variant_combo(combo_name):
-    result = []
-    for x in build_variant_combos:
-        if x[0] == combo_name:
-            result.extend(x[1])
-            break
-    verbose("Resolving combo: " + combo_name + "->" + str(result))
-    return result
-
-
-# given a list of build variant names which may contain combos, return an array with all combos replaced
-# by their content
-def resolve_combos_in_list(unresolved_list):
-    result = []
-    for x in unresolved_list:
-        unrolled = resolve_build_variant_combo(x)
-        if len(unrolled) > 0:
-            result.extend(unrolled)
-        else:
-            result.append(x)
-    return result
+# Phase markers in the make output. A phase lasts from its marker line to the next marker line (or to the
+# end of the step). Since make runs jobs in parallel, phases overlap in reality; the phase durations tell
+# us which part of the build is active, not what it costs in cpu.
+make_phase_markers = (
+    # <regex>, <phase name template>, <group index of the number of files compiled, or None>
+    (re.compile(r'^Compiling (\d+) files? for (\S+)'), r'Compiling \2', 1),
+    (re.compile(r'^Creating (.+?)(?: from \d+ file\(s\))?$'), r'Creating \1', None),
+    (re.compile(r'^Linking (.+)$'), r'Linking \1', None),
+    (re.compile(r'^Building target \'(\S+)\''), r'Building target \1', None),
+    (re.compile(r'^Optimizing (.+)$'), r'Optimizing \1', None),
+    (re.compile(r'^Finished building target'), r'Finished', None),
+)
 
 
-def trc(text):
-    print("--- " + text)
+# If the line is a phase marker, returns (phase name, number of files compiled), otherwise None
+def match_make_phase_marker(line):
+    for regex, name_template, files_group in make_phase_markers:
+        m = regex.match(line)
+        if m is not None:
+            files_compiled = int(m.group(files_group)) if files_group is not None else 0
+            return m.expand(name_template), files_compiled
+    return None
 
 
-def verbose(text):
-    if args.is_verbose:
-        print("--- " + text)
-
+# Run a single build step (configure, clean, make) in the given directory.
+# Output is streamed line by line into log_dir/<step>-<run id>.log, each line
+# prefixed with the elapsed time since the step started ("[12.345s] ..."). Only the last
+# --tail-lines lines are kept in memory, for error reporting.
+# Returns a step record (a dict) with the log file name, exit code, wall clock, user and system cpu time
+# and peak rss of the step (including all child processes), as well as the make phases seen in the output
+# and the number of files compiled.
+# If the step fails, a BuildError is raised, carrying the step record.
+# label: what we build (the variant, or codeline/variant in a build matrix), for --live output
+# env: additional environment variables for the step, or None
+def run_build_step(command, cwd, log_dir, step_name, label, env=None):
+    verbose('calling: ' + ' '.join(command) + ' (in ' + cwd + ')')
+    pathlib.Path(log_dir).mkdir(parents=True, exist_ok=True)
+    log_file_name = log_dir + '/' + step_name + '-' + run_id + '.log'
+    tail = collections.deque(maxlen=args.tail_lines)
+
+    phases = []
+    files_compiled = 0
+
+    start = time.monotonic()
+    with open(log_file_name, mode='w', encoding='utf-8') as log_file:
+        log_file.write('# command: ' + ' '.join(command) + '\n')
+        log_file.write('# started: ' + time.strftime('%Y-%m-%dT%H:%M:%S%z') + ' (' + str(time.time()) + ')\n')
+        full_env = None
+        if env is not None:
+            full_env = dict(os.environ)
+            full_env.update(env)
+        with subprocess.Popen(command, cwd=cwd, env=full_env, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT) as process:
+            for raw_line in process.stdout:
+                line = raw_line.decode('utf-8', errors='replace').rstrip('\n')
+                elapsed = time.monotonic() - start
+                log_file.write('[%.3fs] %s\n' % (elapsed, line))
+                tail.append(line)
+                if args.live:
+                    print('[' + label + '] ' + line, flush=True)
+                marker = match_make_phase_marker(line)
+                if marker is not None:
+                    if len(phases) > 0:
+                        phases[-1]['duration'] = round(max(0.0, elapsed - phases[-1]['start']), 3)
+                    phases.append({'name': marker[0], 'start': round(elapsed, 3), 'duration': None})
+                    files_compiled += marker[1]
+            # Reap the child ourselves: unlike Popen.wait(), wait4 gives us the resource usage of the
+            # step (which includes all its reaped descendants), even if other steps run concurrently.
+            pid, status, rusage = os.wait4(process.pid, 0)
+            exit_code = os.waitstatus_to_exitcode(status)
+            process.returncode = exit_code
+        wall = time.monotonic() - start
+        log_file.write('# finished: exit code ' + str(exit_code) + ' after %.3fs\n' % wall)
+
+    if len(phases) > 0:
+        phases[-1]['duration'] = round(max(0.0, wall - phases[-1]['start']), 3)
+
+    step = {
+        'step': step_name,
+        'command': command,
+        'log': log_file_name,
+        'exit-code': exit_code,
+        'wall': round(wall, 3),
+        'user': round(rusage.ru_utime, 3),
+        'sys': round(rusage.ru_stime, 3),
+        'max-rss-kb': rusage.ru_maxrss,
+        'files-compiled': files_compiled,
+        'phases': phases
+    }
+
+    verbose('log: ' + log_file_name)
+    if exit_code != 0:
+        trc('Command failed ' + ' '.join(command) + ' (exit code ' + str(exit_code) + '). Last lines of output:')
+        for line in tail:
+            print('    ' + line)
+        trc('Full log: ' + log_file_name)
+        raise BuildError(step_name + ' failed with exit code ' + str(exit_code) + ', see ' + log_file_name, [step])
+    return step
+
+
+########################################
+# Compiler cache support. With --ccache, all variants of all codelines share one ccache directory. Since
+# configure makes ccache rewrite paths relative to the source tree, objects compiled with the same flags
+# can be reused across variants and codelines.
+
+def ccache_dir():
+    if args.ccache_dir is not None:
+        return args.ccache_dir
+    return ojdk_root + '/ccache'
+
+
+def ccache_configure_options():
+    return ["--enable-ccache", "--with-ccache-dir=" + ccache_dir()]
+
+
+def run_ccache_command(ccache_args):
+    pathlib.Path(ccache_dir()).mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ)
+    env['CCACHE_DIR'] = ccache_dir()
+    verbose('calling: ccache ' + ' '.join(ccache_args))
+    try:
+        return subprocess.check_output(['ccache'] + ccache_args, env=env).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError) as e:
+        trc('ccache ' + ' '.join(ccache_args) + ' failed: ' + str(e))
+        return None
+
+
+# Every compilation appends its result to the ccache stats log: a "# <source file>" line, followed by the names
+# of all counters the compilation incremented, one per line (a miss, for example, increments
+# direct_cache_miss, preprocessed_cache_miss, cache_miss and local_storage_miss). We give each make step its
+# own stats log, so that we get per-build numbers even if builds run in parallel.
+# Every compilation is counted once: as a miss if it has cache_miss, as a hit if it has direct_cache_hit or
+# preprocessed_cache_hit, otherwise as uncacheable (called for linking, unsupported option, ...).
+# Returns a dict with the number of hits, misses and uncacheable compilations, or None if there is no log.
+def read_ccache_stats_log(stats_log_file_name):
+    stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+
+    def count(counters):
+        if "cache_miss" in counters:
+            stats['misses'] += 1
+        elif "direct_cache_hit" in counters or "preprocessed_cache_hit" in counters:
+            stats['hits'] += 1
+        else:
+            stats['uncacheable'] += 1
 
-def run_command_and_return_stdout(command):
-    verbose('calling: ' + ' '.join(command))
+    counters = None
+    try:
+        with open(stats_log_file_name) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#"):
+                    if counters is not None:
+                        count(counters)
+                    counters = set()
+                elif line != "" and counters is not None:
+                    counters.add(line)
+    except OSError:
+        return None
+    if counters is not None:
+        count(counters)
+    return stats
+
+
+def format_ccache_stats(stats):
+    if stats is None:
+        return "-"
+    lookups = stats['hits'] + stats['misses']
+    if lookups == 0:
+        return "0/0"
+    return str(stats['hits']) + "/" + str(lookups) + " (" + str(100 * stats['hits'] // lookups) + "%)"
+
+
+# Update output_dir/compile_commands.json from the newest make log (see scan-build-log.py)
+def update_compile_commands(output_dir):
+    scanner = str(pathlib.Path(__file__).resolve().parent / "scan-build-log.py")
     try:
-        stdout = subprocess.check_output(command)
+        subprocess.check_output([sys.executable, scanner, "--output-dir", output_dir, "--compile-commands"])
     except subprocess.CalledProcessError as e:
-        trc('Command failed ' + ' '.join(command))
-        print(e)
-        sys.exit('Sowwy :-(')
-    stdout = stdout.decode("utf-8")
-    verbose('out: ' + stdout)
-    return stdout
+        trc("Failed to update compile_commands.json in " + output_dir + ": " + str(e))
 
 
-def are_there_outgoing_changes_in_repo():
-    outgoing_changes = run_command_and_return_stdout(['hg', 'out', '-q'])
+def are_there_outgoing_changes_in_repo(source):
+    outgoing_changes = run_command_and_return_stdout(['hg', 'out', '-q'], source)
     return len(outgoing_changes) > 0
 
 
-def are_there_uncommitted_changes_in_workspace():
-    uncommitted_changes = run_command_and_return_stdout(['hg', 'diff'])
+def are_there_uncommitted_changes_in_workspace(source):
+    uncommitted_changes = run_command_and_return_stdout(['hg', 'diff'], source)
     return len(uncommitted_changes) > 0
 
 
+# The configure fingerprint is stored in the output directory after a successful configure run. If
+# neither the configure options nor the configure scripts changed since, we skip configure.
+configure_fingerprint_file_name = '.configure-fingerprint'
+
+
+# hash all configure sources (source/configure and everything under source/make/autoconf)
+def hash_configure_scripts(source):
+    h = hashlib.sha256()
+    files = [pathlib.Path(source + '/configure')]
+    files.extend(sorted(p for p in pathlib.Path(source + '/make/autoconf').rglob('*') if p.is_file()))
+    for p in files:
+        if p.exists():
+            h.update(str(p.relative_to(source)).encode('utf-8'))
+            h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+# returns the fingerprint of a configure run as a dict. Note that boot jdk, gtest and build jdk
+# are part of the configure options.
+def configure_fingerprint(configure_options, configure_scripts_hash):
+    return {
+        'configure-options': configure_options,
+        'configure-scripts': configure_scripts_hash
+    }
+
+
+def configure_fingerprint_matches(output_dir, fingerprint):
+    # if configure never finished (or someone deleted the spec), we have to run it regardless
+    if not pathlib.Path(output_dir + '/spec.gmk').exists():
+        return False
+    try:
+        with open(output_dir + '/' + configure_fingerprint_file_name) as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+
+def write_configure_fingerprint(output_dir, fingerprint):
+    with open(output_dir + '/' + configure_fingerprint_file_name, mode='w') as f:
+        json.dump(fingerprint, f, indent=2)
+
+
+def remove_configure_fingerprint(output_dir):
+    pathlib.Path(output_dir + '/' + configure_fingerprint_file_name).unlink(missing_ok=True)
+
+
 # run one build for the given variant and the given mode (see --mode)
-def run_build_for_variant(codeline, variant_name, mode, build_jdk):
+# make_jobs: if not None, number of jobs the make step may use (passed as JOBS=)
+# Returns the list of step records of all steps run (see run_build_step)
+def run_build_for_variant(codeline, variant_name, mode, build_jdk, make_jobs=None):
     verbose("Building: codeline " + codeline + ", variant: " + variant_name + ", mode: " + mode)
 
-    codeline_data = codeline_data_by_name(codeline)
-    boot_jdk = codeline_data[1]
+    boot_jdk = registry.codeline(codeline)['boot-jdk']
 
-    variant_data = variant_data_by_name(variant_name)
-    configure_options = variant_data[1].split()
+    configure_options = registry.variant(variant_name)['configure'].split()
 
-    configure_options.append("--with-boot-jdk=" + ojdk_root + "/jdks/" + boot_jdk)
+    # jdks/<name> (as set up by create-all-codelines.py), or the unpacked boot jdk in the shared cache
+    try:
+        boot_jdk_dir = bootjdks.resolve_jdk(boot_jdk, ojdk_root + "/jdks", args.jdk_cache)
+    except bootjdks.BootJdkError as e:
+        raise BuildError(str(e))
+    if boot_jdk_dir is None and args.dry_run:
+        boot_jdk_dir = ojdk_root + "/jdks/" + boot_jdk
+    elif boot_jdk_dir is None:
+        raise BuildError("Boot jdk " + boot_jdk + " not found in " + ojdk_root + "/jdks or in " + args.jdk_cache +
+                         ". Run create-all-codelines.py, or install it manually.")
+    configure_options.append("--with-boot-jdk=" + boot_jdk_dir)
 
     configure_options.append("--with-gtest=" + "/shared/projects/openjdk/gtest/latest/")
 
     if build_jdk is not None:
         configure_options.append("--with-build-jdk=" + build_jdk)
 
+    if args.ccache:
+        configure_options.extend(ccache_configure_options())
+
     verbose("Configure options: " + str(configure_options))
 
     # create output dir
-    output_dir = output_dir_for_variant(variant_name)
-    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    output_dir = output_dir_for_variant(codeline, variant_name)
+    try:
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        raise BuildError(str(e))
     verbose("Output dir: " + output_dir)
 
-    os.chdir(output_dir)
+    # Note: we don't chdir into the output dir, since other variants may be built concurrently.
 
-    # run configure
+    label = variant_name if len(args.codelines) == 1 else codeline + "/" + variant_name
+    steps = []
+    try:
+        run_build_steps_for_variant(codeline, variant_name, label, mode, configure_options, output_dir, make_jobs,
+                                    steps)
+    except BuildError as e:
+        raise BuildError(str(e), steps + e.steps)
+    except OSError as e:
+        # e.g. make not found; keep the steps which did run
+        raise BuildError(str(e), steps)
+    return steps
+
+
+# helper for run_build_for_variant: runs configure, clean and make as needed for the mode,
+# and appends the step records to steps
+def run_build_steps_for_variant(codeline, variant_name, label, mode, configure_options, output_dir, make_jobs,
+                                steps):
+    log_dir = build_log_dir(codeline, variant_name)
+
+    # run configure, unless it already ran successfully with the same options and configure scripts
     if mode == "configure-only" or mode == "full":
         command = ["bash", "../source/configure"] + configure_options
-        if args.dry_run:
+        fingerprint = configure_fingerprint(configure_options, hash_configure_scripts(source_dir(codeline)))
+        if not args.force_configure and configure_fingerprint_matches(output_dir, fingerprint):
+            trc(label + ": configure inputs unchanged, skipping configure (use --force-configure to rerun).")
+        elif args.dry_run:
             verbose("(Dry run): " + str(command))
         else:
-            run_command_and_return_stdout(command)
+            remove_configure_fingerprint(output_dir)
+            steps.append(run_build_step(command, output_dir, log_dir, "configure", label))
+            write_configure_fingerprint(output_dir, fingerprint)
 
     # clean
     if mode == "full":
@@ -195,29 +403,574 @@ def run_build_for_variant(codeline, variant_name, mode, build_jdk):
         if args.dry_run:
             verbose("(Dry run): " + str(command))
         else:
-            run_command_and_return_stdout(["make", "clean"])
+            steps.append(run_build_step(command, output_dir, log_dir, "clean", label))
 
     if mode == "full" or mode == "incremental":
         targets = args.target.split()
         command = ["make"] + targets
+        if make_jobs is not None:
+            command.append("JOBS=" + str(make_jobs))
+        if args.compile_commands:
+            # we need the compile command lines in the log
+            command.append("LOG=cmdlines")
         if args.dry_run:
             verbose("(Dry run): " + str(command))
+        elif args.ccache:
+            stats_log_file_name = log_dir + '/ccache-stats-' + run_id + '.log'
+            step = run_build_step(command, output_dir, log_dir, "make", label, {'CCACHE_STATSLOG': stats_log_file_name})
+            step['ccache'] = read_ccache_stats_log(stats_log_file_name)
+            steps.append(step)
         else:
-            run_command_and_return_stdout(command)
+            steps.append(run_build_step(command, output_dir, log_dir, "make", label))
+        if args.compile_commands and not args.dry_run:
+            update_compile_commands(output_dir)
 
 
 # End: def run_build_for_variant(variant_name, mode):
 
 
+# Given the number of builds to run concurrently, return the number of make jobs each
+# concurrent make gets, or None if we leave that to configure (sequential build, no --jobs)
+def make_jobs_per_variant(num_variants, parallel, jobs_budget):
+    concurrent_builds = max(1, min(parallel, num_variants))
+    if jobs_budget is None:
+        if concurrent_builds == 1:
+            return None
+        jobs_budget = os.cpu_count() or 1
+    return max(1, jobs_budget // concurrent_builds)
+
+
+# Run the given builds (a list of (codeline, variant) tuples), up to <parallel> of them at once, in the given
+# order, splitting the global jobs budget between the concurrent makes.
+# Returns a list of build results in build order. Each one is a dict with the codeline, the variant name, the
+# result ("OK", "FAILED: <reason>" or "SKIPPED") and the step records of the steps run.
+# In sequential mode (parallel == 1) for a single codeline, we stop at the first failed build like we always
+# did; in parallel mode and in matrix runs (several codelines) all builds are run and failures are collected.
+def run_builds_for_variants(builds, mode, build_jdk, parallel, jobs_budget):
+    # the same build twice would mean two builds in the same output dir at the same time
+    builds = list(dict.fromkeys(builds))
+    make_jobs = make_jobs_per_variant(len(builds), parallel, jobs_budget)
+    if make_jobs is not None:
+        trc("Building " + str(min(parallel, len(builds))) + " variant(s) concurrently, " +
+            str(make_jobs) + " make jobs each.")
+
+    results = {}
+
+    if parallel <= 1:
+        failed = False
+        stop_at_failure = len(args.codelines) == 1
+        for codeline, variant_name in builds:
+            verbose("Variant: " + variant_name)
+            if failed and stop_at_failure:
+                results[(codeline, variant_name)] = ("SKIPPED", [])
+                continue
+            try:
+                results[(codeline, variant_name)] = ("OK", run_build_for_variant(codeline, variant_name, mode,
+                                                                                 build_jdk, make_jobs))
+            except BuildError as e:
+                results[(codeline, variant_name)] = ("FAILED: " + str(e), e.steps)
+                failed = True
+    else:
+        # the executor starts the builds in the order they were submitted
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = {}
+            for codeline, variant_name in builds:
+                futures[executor.submit(run_build_for_variant, codeline, variant_name, mode, build_jdk,
+                                        make_jobs)] = (codeline, variant_name)
+            for future in concurrent.futures.as_completed(futures):
+                build = futures[future]
+                label = build[1] if len(args.codelines) == 1 else build[0] + "/" + build[1]
+                try:
+                    results[build] = ("OK", future.result())
+                    trc("Variant " + label + " done.")
+                except BuildError as e:
+                    results[build] = ("FAILED: " + str(e), e.steps)
+                    trc("Variant " + label + " failed.")
+
+    return [{'codeline': codeline, 'variant': variant_name, 'result': results[(codeline, variant_name)][0],
+             'steps': results[(codeline, variant_name)][1]}
+            for codeline, variant_name in builds]
+
+
+# Order the builds for a parallel run: longest expected build first, so that the long builds do not end up
+# running alone at the end. The expected duration is the median total time of the recorded successful
+# builds with the same codeline, variant, mode and target. Builds we know nothing about go first, since
+# they may well be the longest.
+def order_builds_by_expected_duration(builds):
+    expected = {}
+    if pathlib.Path(args.db_file).exists():
+        db = open_build_db(args.db_file)
+        for codeline, variant_name in builds:
+            rows = db.execute('SELECT total_s FROM builds WHERE codeline = ? AND variant = ? AND mode = ? AND '
+                              'target = ? AND result = ? ORDER BY time DESC LIMIT 10',
+                              (codeline, variant_name, args.mode, args.target, "OK")).fetchall()
+            if len(rows) > 0:
+                expected[(codeline, variant_name)] = statistics.median(row[0] for row in rows)
+        db.close()
+    ordered = sorted(builds, key=lambda build: -expected.get(build, float('inf')))
+    for build in ordered:
+        verbose("Expected duration of " + build[0] + "/" + build[1] + ": " + format_seconds(expected.get(build)))
+    return ordered
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    return "%.1fs" % seconds
+
+
+def step_by_name(variant_result, step_name):
+    for step in variant_result['steps']:
+        if step['step'] == step_name:
+            return step
+    return None
+
+
+def result_label(variant_result):
+    if len(args.codelines) == 1:
+        return variant_result['variant']
+    return variant_result['codeline'] + "/" + variant_result['variant']
+
+
+def print_build_summary(results):
+    trc("Summary:")
+    label_width = max([20] + [len(result_label(r)) + 2 for r in results])
+    trc("  " + ("variant" if len(args.codelines) == 1 else "codeline/variant").ljust(label_width) + "configure".rjust(10) + "clean".rjust(10) + "make".rjust(10) +
+        "user".rjust(10) + "sys".rjust(10) + "max rss".rjust(10) +
+        ("ccache hits".rjust(18) if args.ccache else "") + "  result")
+    for variant_result in results:
+        line = result_label(variant_result).ljust(label_width)
+        for step_name in ("configure", "clean", "make"):
+            step = step_by_name(variant_result, step_name)
+            line += format_seconds(step['wall'] if step is not None else None).rjust(10)
+        user = sum(step['user'] for step in variant_result['steps'])
+        system = sum(step['sys'] for step in variant_result['steps'])
+        max_rss_mb = max([step['max-rss-kb'] for step in variant_result['steps']] + [0]) // 1024
+        line += format_seconds(user).rjust(10) + format_seconds(system).rjust(10) + (str(max_rss_mb) + "M").rjust(10)
+        if args.ccache:
+            make_step = step_by_name(variant_result, "make")
+            line += format_ccache_stats(make_step.get('ccache') if make_step is not None else None).rjust(18)
+        trc("  " + line + "  " + variant_result['result'])
+
+    # The longest make phases per variant
+    for variant_result in results:
+        step = step_by_name(variant_result, "make")
+        if step is None or len(step['phases']) == 0:
+            continue
+        trc("Longest make phases, " + result_label(variant_result) + ":")
+        for phase in sorted(step['phases'], key=lambda x: x['duration'], reverse=True)[:args.num_phases]:
+            trc("  " + format_seconds(phase['duration']).rjust(10) + "  " + phase['name'])
+
+
+def build_report_dir(codeline):
+    return codeline_root(codeline) + '/build-reports'
+
+
+# Write the results of this run for the given codeline as json into the codeline directory, and return the
+# file name
+def write_build_report(codeline, results):
+    pathlib.Path(build_report_dir(codeline)).mkdir(parents=True, exist_ok=True)
+    report_file_name = build_report_dir(codeline) + '/build-report-' + run_id + '.json'
+    report = {
+        'run-id': run_id,
+        'codeline': codeline,
+        'mode': args.mode,
+        'target': args.target,
+        'parallel': args.parallel,
+        'jobs': args.jobs,
+        'variants': [r for r in results if r['codeline'] == codeline]
+    }
+    with open(report_file_name, mode='w') as f:
+        json.dump(report, f, indent=2)
+    return report_file_name
+
+
+# Build matrix: one consolidated report for all codelines, in <openjdk-root>/build-reports
+def write_matrix_report(results):
+    report_dir = ojdk_root + '/build-reports'
+    pathlib.Path(report_dir).mkdir(parents=True, exist_ok=True)
+    report_file_name = report_dir + '/matrix-report-' + run_id + '.json'
+    report = {
+        'run-id': run_id,
+        'codelines': args.codelines,
+        'mode': args.mode,
+        'target': args.target,
+        'parallel': args.parallel,
+        'jobs': args.jobs,
+        'builds': results
+    }
+    with open(report_file_name, mode='w') as f:
+        json.dump(report, f, indent=2)
+    return report_file_name
+
+
+# Build matrix: codelines x variants, with the total build time or the result
+def print_build_matrix(results, variant_names):
+    by_build = {(r['codeline'], r['variant']): r for r in results}
+    width = max([12] + [len(v) + 2 for v in variant_names])
+    codeline_width = max(len(c) for c in args.codelines) + 2
+    trc("Build matrix:")
+    trc("  " + "".ljust(codeline_width) + "".join(v.rjust(width) for v in variant_names))
+    for codeline in args.codelines:
+        line = codeline.ljust(codeline_width)
+        for variant_name in variant_names:
+            r = by_build.get((codeline, variant_name))
+            if r is None:
+                cell = "-"
+            elif r['result'] == "OK":
+                cell = format_seconds(sum(step['wall'] for step in r['steps']))
+            else:
+                cell = r['result'].split(":")[0]
+            line += cell.rjust(width)
+        trc("  " + line)
+
+
+########################################
+# Build time database: every run appends one row per variant to a sqlite database, so that we can
+# follow build times over time and spot regressions (see --compare).
+
+build_db_schema = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    host TEXT,
+    cpus INTEGER,
+    codeline TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    target TEXT NOT NULL,
+    revision TEXT,
+    result TEXT NOT NULL,
+    exit_code INTEGER,
+    configure_s REAL,
+    clean_s REAL,
+    make_s REAL,
+    total_s REAL,
+    user_s REAL,
+    sys_s REAL,
+    files_compiled INTEGER
+);
+CREATE INDEX IF NOT EXISTS builds_key ON builds (codeline, variant, mode, target, time);
+"""
+
+
+def open_build_db(db_file_name):
+    db = sqlite3.connect(db_file_name)
+    db.executescript(build_db_schema)
+    return db
+
+
+# Returns the revision the source directory is at, or None if we cannot find out
+def source_revision(codeline):
+    for command in (['git', 'rev-parse', 'HEAD'], ['hg', 'id', '-i']):
+        try:
+            out = subprocess.check_output(command, cwd=source_dir(codeline), stderr=subprocess.DEVNULL)
+            return out.decode('utf-8').strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return None
+
+
+def record_build_results(db, results):
+    now = time.time()
+    revisions = {}
+    for variant_result in results:
+        if variant_result['result'] == "SKIPPED":
+            continue
+        steps = variant_result['steps']
+        durations = {}
+        for step_name in ("configure", "clean", "make"):
+            step = step_by_name(variant_result, step_name)
+            durations[step_name] = step['wall'] if step is not None else None
+        exit_code = steps[-1]['exit-code'] if len(steps) > 0 else None
+        codeline = variant_result['codeline']
+        if codeline not in revisions:
+            revisions[codeline] = source_revision(codeline)
+        db.execute('INSERT INTO builds (run_id, time, host, cpus, codeline, variant, mode, target, revision, '
+                   'result, exit_code, configure_s, clean_s, make_s, total_s, user_s, sys_s, files_compiled) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (run_id, now, socket.gethostname(), os.cpu_count(), codeline, variant_result['variant'],
+                    args.mode, args.target, revisions[codeline], "OK" if variant_result['result'] == "OK" else "FAILED",
+                    exit_code, durations['configure'], durations['clean'], durations['make'],
+                    sum(step['wall'] for step in steps), sum(step['user'] for step in steps),
+                    sum(step['sys'] for step in steps), sum(step['files-compiled'] for step in steps)))
+    db.commit()
+
+
+# A run is flagged as slower if its make time exceeds the mean of the baseline by more than
+# <threshold> standard deviations. The baseline are the successful runs preceding it.
+def is_regression(value, baseline, threshold):
+    if value is None or len(baseline) < 3:
+        return False
+    mean = statistics.mean(baseline)
+    stdev = statistics.stdev(baseline)
+    return value > mean + threshold * max(stdev, mean * 0.01)
+
+
+# Print the build time history of the given builds ((codeline, variant) tuples) for the current mode and target
+def print_build_time_comparison(db, builds):
+    for codeline, variant_name in builds:
+        rows = db.execute('SELECT time, host, revision, result, configure_s, clean_s, make_s, total_s, '
+                          'files_compiled FROM builds WHERE codeline = ? AND variant = ? AND mode = ? AND target = ? '
+                          'ORDER BY time', (codeline, variant_name, args.mode, args.target)).fetchall()
+        trc(codeline + ", " + variant_name + " (" + args.mode + ", " + args.target + "): " +
+            str(len(rows)) + " recorded run(s).")
+        if len(rows) == 0:
+            continue
+        trc("  " + "date".ljust(18) + "host".ljust(16) + "revision".ljust(14) + "configure".rjust(10) +
+            "clean".rjust(10) + "make".rjust(10) + "total".rjust(10) + "files".rjust(8) + "  result")
+        for i in range(max(0, len(rows) - args.history), len(rows)):
+            (when, host, revision, result, configure_s, clean_s, make_s, total_s, files_compiled) = rows[i]
+            baseline = [row[6] for row in rows[max(0, i - args.baseline):i] if row[3] == "OK" and row[6] is not None]
+            flag = ""
+            if result == "OK" and is_regression(make_s, baseline, args.threshold):
+                flag = "  SLOWER (baseline make: " + format_seconds(statistics.mean(baseline)) + ")"
+            trc("  " + time.strftime('%Y-%m-%d %H:%M', time.localtime(when)).ljust(18) +
+                (host or "?")[:15].ljust(16) + (revision or "?")[:12].ljust(14) +
+                format_seconds(configure_s).rjust(10) + format_seconds(clean_s).rjust(10) +
+                format_seconds(make_s).rjust(10) + format_seconds(total_s).rjust(10) +
+                str(files_compiled).rjust(8) + "  " + result + flag)
+
+
+########################################
+# Daemon mode (--daemon): stay alive, watch the source directory with inotify (inotifywait, from
+# inotify-tools), and start an incremental build of the given variants as soon as a burst of edits is over
+# (--debounce). A client (--wait) connects via a unix socket in the codeline directory and gets the results
+# of the build covering all changes made before it connected.
+
+def daemon_socket_file(codeline):
+    return codeline_root(codeline) + '/.run_builds-daemon.sock'
+
+
+# changes we don't build for: version control internals, editor backup and swap files
+ignored_change_regex = re.compile(r'(/\.(git|hg)/|~$|\.sw[a-z]$|/\.#|/4913$)')
+
+# directories we don't watch at all (an inotifywait --exclude regex)
+unwatched_directories_regex = r'/\.(git|hg)(/|$)'
+
+max_user_watches_file = '/proc/sys/fs/inotify/max_user_watches'
+
+
+# inotify needs one watch per directory. Warn if the source tree has more directories than the kernel allows
+# watches (the traditional default is 8192; the OpenJDK sources have far more directories).
+def check_inotify_watch_limit(source):
+    try:
+        with open(max_user_watches_file) as f:
+            limit = int(f.read())
+    except (OSError, ValueError):
+        return
+    num_directories = 0
+    for directory, subdirectories, files in os.walk(source):
+        subdirectories[:] = [d for d in subdirectories if d not in (".git", ".hg")]
+        num_directories += 1
+    verbose(str(num_directories) + " directories to watch, limit " + str(limit) + ".")
+    if num_directories > limit:
+        trc("Warning: " + source + " has " + str(num_directories) + " directories, but only " + str(limit) +
+            " inotify watches are allowed (" + max_user_watches_file + "). Raise the limit, e.g. with "
+            "sysctl fs.inotify.max_user_watches=" + str(num_directories * 2) + ".")
+
+
+# Reads the changed files reported by inotifywait and puts ('change', path) into the queue. Once inotifywait
+# watches the whole tree, ('ready', None) is put into the queue; changes made before that may be missed.
+def watch_source(source, events):
+    command = ["inotifywait", "-m", "-r", "-e", "close_write,moved_to,moved_from,create,delete",
+               "--exclude", unwatched_directories_regex, "--format", "%w%f", source]
+    verbose('calling: ' + ' '.join(command))
+    try:
+        watcher = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   errors='replace')
+    except OSError as e:
+        events.put(('error', "Cannot run inotifywait (inotify-tools): " + str(e)))
+        return None
+
+    def read_changes():
+        for line in watcher.stdout:
+            path = line.rstrip('\n')
+            if not ignored_change_regex.search(path):
+                events.put(('change', path))
+        events.put(('error', "inotifywait exited with exit code " + str(watcher.wait())))
+
+    # inotifywait reports setting up the watches, and problems, on stderr
+    def read_messages():
+        for line in watcher.stderr:
+            line = line.rstrip('\n')
+            if line.startswith("Watches established"):
+                events.put(('ready', None))
+            elif line.startswith("Setting up watches"):
+                verbose(line)
+            else:
+                trc("inotifywait: " + line)
+                if "upper limit on inotify watches" in line:
+                    trc("Raise the limit, e.g. with sysctl fs.inotify.max_user_watches=<more>.")
+
+    threading.Thread(target=read_changes, daemon=True).start()
+    threading.Thread(target=read_messages, daemon=True).start()
+    return watcher
+
+
+# Accepts client connections and puts (<request>, connection) into the queue. A client has to send its request
+# right away; an idle client must not keep the others waiting.
+def serve_clients(server, events):
+    while True:
+        connection, address = server.accept()
+        try:
+            connection.settimeout(5)
+            request = json.loads(connection.makefile().readline())
+            connection.settimeout(None)
+            events.put((request.get('command'), connection))
+        except (OSError, ValueError, AttributeError):
+            connection.close()
+
+
+def send_to_client(connection, response):
+    try:
+        connection.sendall((json.dumps(response) + "\n").encode('utf-8'))
+    except OSError:
+        pass
+    connection.close()
+
+
+# Returns False if the daemon died (inotifywait missing or gone), True if it was stopped (Ctrl-C).
+def run_daemon(codeline, variant_names):
+    global run_id
+    source = source_dir(codeline)
+    socket_file = daemon_socket_file(codeline)
+    builds = [(codeline, v) for v in variant_names]
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if pathlib.Path(socket_file).exists():
+            # left over from a daemon that did not exit cleanly, unless one is still running
+            try:
+                server.connect(socket_file)
+                sys.exit('There is a daemon running for ' + codeline + ' already.')
+            except ConnectionRefusedError:
+                os.remove(socket_file)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_file)
+        server.listen()
+    except OSError as e:
+        sys.exit('Cannot listen on ' + socket_file + ': ' + str(e))
+
+    check_inotify_watch_limit(source)
+    events = queue.Queue()
+    watcher = watch_source(source, events)
+    threading.Thread(target=serve_clients, args=(server, events), daemon=True).start()
+
+    # per variant: result of the last build, when it finished, number of builds
+    variant_states = {v: {'result': None, 'finished': None, 'builds': 0} for v in variant_names}
+    last_change = None         # once the watches are established, we start with a build, to know where we are
+    ready = False              # the watches are established, and the first build is done
+    waiters = []               # (connection, time of the request)
+    num_builds = 0
+    trc("Daemon for " + codeline + " (" + ", ".join(variant_names) + "), watching " + source + ", socket " +
+        socket_file + ". Setting up watches...")
+    try:
+        while True:
+            # wait for the next event, or until the current burst of edits is over
+            timeout = None
+            if last_change is not None:
+                timeout = max(0.0, last_change + args.debounce - time.time())
+            elif ready and len(waiters) > 0:
+                timeout = max(0.0, min(t for c, t in waiters) + args.debounce - time.time())
+            try:
+                kind, payload = events.get(timeout=timeout)
+                if kind == 'change':
+                    verbose("changed: " + payload)
+                    last_change = time.time()
+                elif kind == 'ready':
+                    trc("Watches established.")
+                    last_change = time.time() - args.debounce
+                elif kind == 'wait':
+                    waiters.append((payload, time.time()))
+                elif kind == 'error':
+                    trc(payload)
+                    for connection, requested in waiters:
+                        send_to_client(connection, {'error': 'daemon died: ' + payload})
+                    return False
+                else:
+                    send_to_client(payload, {'error': 'unknown command'})
+                continue
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            if last_change is not None and now >= last_change + args.debounce:
+                last_change = None
+                num_builds += 1
+                run_id = time.strftime('%Y%m%d-%H%M%S') + '-' + str(num_builds)
+                trc("Building...")
+                try:
+                    results = run_builds_for_variants(builds, "incremental", args.build_jdk, args.parallel,
+                                                      args.jobs)
+                    print_build_summary(results)
+                except Exception as e:
+                    # keep the daemon alive, and tell the clients
+                    trc("Build failed: " + str(e))
+                    results = [{'variant': v, 'result': "FAILED: " + str(e), 'steps': []} for v in variant_names]
+                ready = True
+                for r in results:
+                    state = variant_states[r['variant']]
+                    state['result'] = r['result']
+                    state['finished'] = time.time()
+                    state['builds'] += 1
+                    state['steps'] = r['steps']
+                # edits made during the build are in the queue, and will trigger the next build
+                continue
+
+            # Nothing pending: answer the clients which connected at least one debounce period ago, since
+            # all changes made before they connected have been seen and built by now.
+            if ready and last_change is None:
+                for connection, requested in [w for w in waiters if w[1] + args.debounce <= now]:
+                    send_to_client(connection, {'variants': variant_states})
+                waiters = [w for w in waiters if w[1] + args.debounce > now]
+    except KeyboardInterrupt:
+        trc("Stopping.")
+        return True
+    finally:
+        if watcher is not None:
+            watcher.terminate()
+        server.close()
+        pathlib.Path(socket_file).unlink(missing_ok=True)
+
+
+# Client side of --daemon: wait for the daemon of the codeline to build all changes made so far, print the
+# results, and exit with an error if a build failed.
+def wait_for_daemon(codeline):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(daemon_socket_file(codeline))
+        client.sendall((json.dumps({'command': 'wait'}) + "\n").encode('utf-8'))
+        response = json.loads(client.makefile().readline())
+    except (OSError, ValueError) as e:
+        sys.exit('No daemon running for ' + codeline + ' (' + str(e) + '). Start one with --daemon.')
+    if 'error' in response:
+        sys.exit('Daemon for ' + codeline + ': ' + response['error'])
+    failed = False
+    for variant_name, state in response['variants'].items():
+        finished = time.strftime('%H:%M:%S', time.localtime(state['finished'])) if state['finished'] else "-"
+        make_step = step_by_name(state, "make") if 'steps' in state else None
+        trc(variant_name.ljust(20) + finished.rjust(10) +
+            format_seconds(make_step['wall'] if make_step is not None else None).rjust(10) + "  " +
+            str(state['result']))
+        failed = failed or state['result'] != "OK"
+    if failed:
+        sys.exit('Sowwy :-(')
+
+
 parser = argparse.ArgumentParser(
     description='Runs a sequence of OpenJDK builds.'
 )
 
-valid_codelines = valid_codelines()
+valid_codelines = registry.codeline_names()
 default_codeline = valid_codelines[0]
 
-parser.add_argument("-c", "--codeline", default=default_codeline, metavar="CODELINE",
-                    help="Codeline (repository) to build. Default: %(default)s. Valid values: %(choices)s.",
+parser.add_argument("-c", "--codeline", dest="codelines", default=None, action="append", metavar="CODELINE",
+                    help="Codeline (repository) to build. Can be given several times, to build all variants for "
+                         "all codelines (a build matrix; a failed build does not stop the others). Default: " +
+                         default_codeline + ". "
+                         "Valid values: %(choices)s.",
                     choices=valid_codelines)
 
 parser.add_argument("-v", "--verbose", dest="is_verbose", default=False,
@@ -247,12 +1000,91 @@ parser.add_argument("--dry-run", dest="dry_run", default=False, action="store_tr
 parser.add_argument("--openjdk-root", dest="ojdk_root", default=ojdk_root,
                     help="Openjdk base directory. Serves as base directory for other paths. Default: %(default)s.")
 
+parser.add_argument("--jdk-cache", dest="jdk_cache", default=bootjdks.default_cache_dir(), metavar="DIR",
+                    help="Cache of boot jdks (see bootjdks.py), used if a boot jdk is not in <openjdk-root>/jdks. "
+                         "Default: %(default)s.")
+
 parser.add_argument("--build-jdk", dest="build_jdk",
                     help="Build jdk to use, translates to --with-build-jdk option. If omitted, this option is omitted on configure.")
 
+parser.add_argument("--force-configure", dest="force_configure", default=False, action="store_true",
+                    help="Always run configure, even if configure options and configure scripts did not change "
+                         "since the last successful configure run.")
+
+parser.add_argument("--ccache", dest="ccache", default=False, action="store_true",
+                    help="Build with ccache (configure --enable-ccache), using a cache directory shared by all "
+                         "variants and codelines. Cache hits are reported per variant in the summary.")
+
+parser.add_argument("--ccache-dir", dest="ccache_dir", default=None, metavar="DIR",
+                    help="ccache directory. Default: <openjdk-root>/ccache.")
+
+parser.add_argument("--ccache-size", dest="ccache_size", default=None, metavar="SIZE",
+                    help="Set the maximum size of the ccache (e.g. 50G) before building. ccache evicts the least "
+                         "recently used objects beyond that size.")
+
+parser.add_argument("--ccache-cleanup", dest="ccache_cleanup", default=False, action="store_true",
+                    help="After building, evict objects until the ccache fits its size limits again.")
+
+parser.add_argument("--compile-commands", dest="compile_commands", default=False, action="store_true",
+                    help="Build with LOG=cmdlines and update output-<variant>/compile_commands.json from the make "
+                         "log after each build, for IDE indexers and clang tools. (Newer JDKs can also generate it "
+                         "without building: make compile-commands.)")
+
+parser.add_argument("--live", dest="live", default=False, action="store_true",
+                    help="Print build output as it happens, prefixed with the variant name. Full output is always "
+                         "written to <codeline>/build-logs/<variant>.")
+
+parser.add_argument("--tail-lines", dest="tail_lines", default=50, type=int, metavar="N",
+                    help="Number of output lines to show if a build step fails. Default: %(default)s.")
+
+parser.add_argument("--num-phases", dest="num_phases", default=5, type=int, metavar="N",
+                    help="Number of longest make phases to show per variant in the summary. Default: %(default)s.")
+
+parser.add_argument("-p", "--parallel", dest="parallel", default=1, type=int, metavar="N",
+                    help="Build up to N variants concurrently. Failed builds do not stop the other builds; "
+                         "a per-variant result is reported at the end. Builds with the longest recorded build "
+                         "times start first. Default: %(default)s.")
+
+parser.add_argument("-j", "--jobs", dest="jobs", default=None, type=int, metavar="JOBS",
+                    help="Global make jobs budget, split evenly between concurrently running builds. "
+                         "Default: number of cpus if building in parallel, otherwise left to configure.")
+
+parser.add_argument("--db", dest="db_file", default=None, metavar="FILE",
+                    help="Build time database (sqlite) to append results to. Default: <openjdk-root>/build-times.db.")
+
+parser.add_argument("--no-db", dest="no_db", default=False, action="store_true",
+                    help="Don't record the results of this run in the build time database.")
+
+parser.add_argument("--compare", dest="compare", default=False, action="store_true",
+                    help="Don't build. Instead, show the recorded build times of the given variants for codeline, "
+                         "mode and target, and flag runs that were significantly slower than the runs before them.")
+
+parser.add_argument("--history", dest="history", default=10, type=int, metavar="N",
+                    help="--compare: number of recent runs to show per variant. Default: %(default)s.")
+
+parser.add_argument("--baseline", dest="baseline", default=10, type=int, metavar="N",
+                    help="--compare: number of preceding runs that form the baseline of a run. Default: %(default)s.")
+
+parser.add_argument("--threshold", dest="threshold", default=2.0, type=float, metavar="SIGMA",
+                    help="--compare: flag a run as slower if its make time exceeds the baseline mean by more than "
+                         "SIGMA standard deviations. Default: %(default)s.")
+
+parser.add_argument("--daemon", dest="daemon", default=False, action="store_true",
+                    help="Stay alive, watch the source directory (needs inotifywait) and run an incremental build of "
+                         "the given variants whenever sources changed. Use --wait to wait for the result. inotify "
+                         "needs one watch per source directory; the OpenJDK sources have more directories than the "
+                         "traditional default fs.inotify.max_user_watches of 8192, raise it (sysctl) if needed.")
+
+parser.add_argument("--debounce", dest="debounce", default=0.5, type=float, metavar="SECONDS",
+                    help="--daemon: start building once there were no changes for this long. Default: %(default)s.")
+
+parser.add_argument("--wait", dest="wait", default=False, action="store_true",
+                    help="Don't build. Wait for the daemon of the codeline (see --daemon) to build all changes made "
+                         "so far, and print the results.")
+
 # positional args
-parser.add_argument("build_variants", default=build_variant_combos[0][1], nargs='+', metavar="BUILD-VARIANT",
-                    choices=valid_build_variants() + valid_build_variant_combos(),
+parser.add_argument("build_variants", default=registry.default_combo(), nargs="*", metavar="BUILD-VARIANT",
+                    choices=registry.variant_names() + registry.combo_names(),
                     help="Variant(s) to build. Default: %(default)s. "
                          "Valid values: %(choices)s.")
 
@@ -260,12 +1092,38 @@ args = parser.parse_args()
 if args.is_verbose:
     trc(str(args))
 
+ojdk_root = args.ojdk_root
+
+if isinstance(args.build_variants, str):
+    # the default
+    args.build_variants = [args.build_variants]
+
+if args.codelines is None:
+    args.codelines = [default_codeline]
+# remove duplicates, keep the order
+args.codelines = list(dict.fromkeys(args.codelines))
+
+if args.db_file is None:
+    args.db_file = ojdk_root + '/build-times.db'
+
+if args.wait:
+    wait_for_daemon(args.codelines[0])
+    sys.exit(0)
+
 ####################################
 # resolve build variant combos ("some", "all")
 
-variants_to_build = resolve_combos_in_list(args.build_variants)
+variants_to_build = registry.resolve_variants(args.build_variants)
+verbose("Resolved variants: " + str(variants_to_build))
+
+if args.compare:
+    if not pathlib.Path(args.db_file).exists():
+        sys.exit('Cannot find build time database at ' + args.db_file + '.')
+    print_build_time_comparison(open_build_db(args.db_file),
+                                [(c, v) for c, v, t in registry.expand_matrix(args.codelines, variants_to_build, [""])])
+    sys.exit(0)
 
-trc("Building: " + args.codeline + ", variants: " + str(variants_to_build))
+trc("Building: " + ", ".join(args.codelines) + ", variants: " + str(variants_to_build))
 
 ####################################
 # Sanity
@@ -273,50 +1131,95 @@ trc("Building: " + args.codeline + ", variants: " + str(variants_to_build))
 if not pathlib.Path(ojdk_root).exists():
     sys.exit('Cannot find openjdk root directory at ' + ojdk_root + '.');
 
-if not pathlib.Path(source_dir()).exists():
-    sys.exit('Cannot find source directory at ' + source_dir() + '.')
+for codeline_to_build in args.codelines:
+    if not pathlib.Path(source_dir(codeline_to_build)).exists():
+        sys.exit('Cannot find source directory at ' + source_dir(codeline_to_build) + '.')
+
+if args.daemon:
+    if len(args.codelines) > 1:
+        sys.exit('--daemon works for one codeline only.')
+    if not run_daemon(args.codelines[0], variants_to_build):
+        sys.exit('Sowwy :-(')
+    sys.exit(0)
 
 #####################################
 # Preparation:
 
-curdir = os.getcwd()
-
-# in pull mode, we expect the workspace to be empty and no outgoing changes to be present
-if args.pull:
-
-    os.chdir(source_dir())
-    trc("--pull specified: attempting to pull new changes...")
+# in pull mode, we expect the workspace to be empty and no outgoing changes to be present.
+# Raises BuildError if the source cannot be updated.
+def update_source(codeline):
+    source = source_dir(codeline)
 
     # we should have no uncommitted changes.
-    if are_there_uncommitted_changes_in_workspace():
-        sys.exit('There are uncommitted changes in the workspace. Please commit/qrefresh your changes and try again.')
+    if are_there_uncommitted_changes_in_workspace(source):
+        raise BuildError(codeline + ': There are uncommitted changes in the workspace. Please commit/qrefresh your '
+                         'changes and try again.')
     else:
-        verbose("No uncommitted changes found... OK.")
+        verbose(codeline + ": No uncommitted changes found... OK.")
 
     # outgoing changes we either autopop (and assume they are mercurial changes), or abort
-    if are_there_outgoing_changes_in_repo():
+    if are_there_outgoing_changes_in_repo(source):
         if args.qpop:
-            trc("Found outgoing changes. Attempting to qpop them...")
-            run_command_and_return_stdout(["hg", "qpop", "-a"])
-            if are_there_outgoing_changes_in_repo():
-                sys.exit('Failed to qpop outgoing changes. Are these mq changes? Please manually correct and retry.')
+            trc(codeline + ": Found outgoing changes. Attempting to qpop them...")
+            run_command_and_return_stdout(["hg", "qpop", "-a"], source)
+            if are_there_outgoing_changes_in_repo(source):
+                raise BuildError(codeline + ': Failed to qpop outgoing changes. Are these mq changes? Please '
+                                 'manually correct and retry.')
         else:
-            sys.exit('Found outgoing changes. Please remove or qpop or whatever, then retry.')
+            raise BuildError(codeline + ': Found outgoing changes. Please remove or qpop or whatever, then retry.')
 
     # now pull:
-    pulled = run_command_and_return_stdout(["hg", "pull", "-u"])
-    trc(pulled)
-    trc("Pulled changes. Ok.")
+    pulled = run_command_and_return_stdout(["hg", "pull", "-u"], source)
+    trc(codeline + ": " + pulled)
+    trc(codeline + ": Pulled changes. Ok.")
 
-    os.chdir(curdir)
+
+# The source updates of all codelines run concurrently, before we build anything.
+if args.pull:
+    trc("--pull specified: attempting to pull new changes...")
+    update_errors = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(args.codelines)) as update_executor:
+        update_futures = [update_executor.submit(update_source, c) for c in args.codelines]
+        for update_future in update_futures:
+            try:
+                update_future.result()
+            except BuildError as e:
+                update_errors.append(str(e))
+    if len(update_errors) > 0:
+        sys.exit("\n".join(update_errors))
 
 # Now build.
-# If 'release' is in the list of things to build, build it first
-if 'release' in variants_to_build:
-    variants_to_build.remove('release')
-    variants_to_build = ['release'] + variants_to_build
-    print(variants_to_build)
-
-for this_variant_name in variants_to_build:
-    verbose("Variant: " + this_variant_name)
-    run_build_for_variant(args.codeline, this_variant_name, args.mode, args.build_jdk)
+builds_to_run = [(c, v) for c, v, t in registry.expand_matrix(args.codelines, variants_to_build, [args.target])]
+if args.parallel > 1 and len(builds_to_run) > 1:
+    builds_to_run = order_builds_by_expected_duration(builds_to_run)
+else:
+    # If 'release' is in the list of things to build, build it first
+    builds_to_run = [b for b in builds_to_run if b[1] == 'release'] + [b for b in builds_to_run if b[1] != 'release']
+verbose("Build order: " + str(builds_to_run))
+
+if args.ccache and not args.dry_run:
+    if args.ccache_size is not None:
+        run_ccache_command(["--max-size", args.ccache_size])
+
+build_results = run_builds_for_variants(builds_to_run, args.mode, args.build_jdk, args.parallel, args.jobs)
+print_build_summary(build_results)
+if len(args.codelines) > 1:
+    print_build_matrix(build_results, variants_to_build)
+
+if args.ccache and not args.dry_run:
+    if args.ccache_cleanup:
+        run_ccache_command(["--cleanup"])
+    cache_summary = run_ccache_command(["--show-stats"])
+    if cache_summary is not None:
+        verbose("ccache: " + cache_summary)
+
+if not args.dry_run:
+    for codeline_built in args.codelines:
+        trc("Build report: " + write_build_report(codeline_built, build_results))
+    if len(args.codelines) > 1:
+        trc("Matrix report: " + write_matrix_report(build_results))
+    if not args.no_db:
+        record_build_results(open_build_db(args.db_file), build_results)
+
+if any(variant_result['result'] != "OK" for variant_result in build_results):
+    sys.exit('Sowwy :-(')
@@ -0,0 +1,210 @@
+# !/usr/bin/env python3
+
+# Normalizes logs (unified logging output, hs_err files, build logs, ...) so that two runs can be compared:
+# removes uptime decorations and masks timestamps, thread ids, pids and addresses.
+#
+# sanitize-log.py [options] [LOG]         - writes the normalized log to stdout (or -o)
+# sanitize-log.py [options] --diff A B    - diffs two normalized logs (with diff -u), no intermediate files
+#
+# The input is processed in large chunks of whole lines, and every rule is applied to a whole chunk at once
+# instead of line by line; memory use does not depend on the log size.
+
+
+import sys
+import os
+import argparse
+import re
+import subprocess
+import threading
+
+
+def trc(text):
+    print("--- " + text, file=sys.stderr)
+
+
+def error_exit(text):
+    print('*** ERROR: ' + text, file=sys.stderr)
+    sys.exit(':-(')
+
+
+def verbose(text):
+    if args.is_verbose:
+        print("--- " + text, file=sys.stderr)
+
+
+#####################
+# The rules, applied in this order. Every rule is a regex (on bytes, multiline), its replacement, and a
+# string every match contains: a chunk without it is skipped, which is much cheaper than running the regex.
+# Thread ids and pids go before addresses, since they are often printed in hex.
+
+RULES = [
+    # uptime decoration: [1.234s], [1234ms], [1234ns]. Removed if it is the first or second decoration
+    # of a line (unified logging with default or time,uptime decorations; logs written by run_builds.py).
+    ('uptime', rb'^(\[[^\]\n]*\])?\[[0-9][0-9,.]*(?:s|ms|ns)\]', rb'\1', b"s]"),
+    # ISO 8601 timestamps (unified logging "time" decorations) and asctime-like ones (hs_err "Time:" line)
+    ('timestamps', rb'\b\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d:?\d\d)?'
+                   rb'|\b[A-Z][a-z]{2} [A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d \d{4}(?: [A-Z]{3,5})?', rb'<timestamp>',
+     b":"),
+    # tid=0x00007f..., nid=0x1a2b (thread dumps), tid 1234 (hs_err)
+    ('tids', rb'\b((?:tid|nid)[=: ]+)(?:0x[0-9a-fA-F]+|\d+)', rb'\1?', b"id"),
+    # pid=1234, pid 1234, pid: 1234
+    ('pids', rb'\b(pid[=: ]+)\d+', rb'\1?', b"pid"),
+    ('addresses', rb'0x[0-9a-fA-F]+', rb'0x????', b"0x"),
+]
+
+RULE_NAMES = [rule[0] for rule in RULES]
+
+
+def compile_rules():
+    rules = []
+    names = RULE_NAMES if args.rules is None else args.rules.split(",")
+    for name in names:
+        if name not in RULE_NAMES:
+            error_exit("Unknown rule " + name + ". Known rules: " + ",".join(RULE_NAMES) + ".")
+    for name, regex, replacement, needle in RULES:
+        if name in names:
+            rules.append((re.compile(regex, re.MULTILINE), replacement, needle))
+    for regex, replacement in args.added_rules:
+        try:
+            rules.append((re.compile(regex.encode(), re.MULTILINE), replacement.encode(), b""))
+        except re.error as e:
+            error_exit("Bad regex " + regex + ": " + str(e))
+    verbose(str(len(rules)) + " rules.")
+    return rules
+
+
+def normalize_chunk(chunk, rules):
+    for regex, replacement, needle in rules:
+        if needle in chunk:
+            chunk = regex.sub(replacement, chunk)
+    return chunk
+
+
+# Reads the input in chunks, cut after the last newline so that no line is split, and writes the
+# normalized chunks to out.
+def normalize_stream(f, out, rules):
+    rest = b""
+    while True:
+        data = f.read(args.chunk_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            rest = data
+            continue
+        rest = data[end:]
+        out.write(normalize_chunk(data[:end], rules))
+    if rest:
+        out.write(normalize_chunk(rest, rules))
+
+
+def open_input(file_name):
+    if file_name == "-":
+        return open(sys.stdin.fileno(), mode='rb', closefd=False)
+    try:
+        return open(file_name, mode='rb')
+    except OSError as e:
+        error_exit("Cannot open " + file_name + ": " + str(e))
+
+
+def normalize_file(file_name, out, rules):
+    with open_input(file_name) as f:
+        normalize_stream(f, out, rules)
+
+
+#####################
+# Diff mode: both logs are normalized by a thread each, into a pipe. diff reads the pipes as /dev/fd/N.
+
+def normalize_into_pipe(file_name, write_fd, rules, errors):
+    try:
+        with open(write_fd, mode='wb') as out:
+            normalize_file(file_name, out, rules)
+    except BrokenPipeError:
+        # diff gave up
+        pass
+    except BaseException as e:
+        errors.append(file_name + ": " + str(e))
+
+
+def diff_logs(file_a, file_b, rules):
+    read_a, write_a = os.pipe()
+    read_b, write_b = os.pipe()
+    command = ["diff", "-u", "--label", file_a, "--label", file_b, "/dev/fd/" + str(read_a), "/dev/fd/" + str(read_b)]
+    verbose(" ".join(command))
+    try:
+        diff = subprocess.Popen(command, pass_fds=(read_a, read_b))
+    except OSError as e:
+        error_exit("Cannot run diff: " + str(e))
+    os.close(read_a)
+    os.close(read_b)
+    errors = []
+    threads = [threading.Thread(target=normalize_into_pipe, args=(file_a, write_a, rules, errors)),
+               threading.Thread(target=normalize_into_pipe, args=(file_b, write_b, rules, errors))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    exit_code = diff.wait()
+    for error in errors:
+        print('*** ERROR: ' + error, file=sys.stderr)
+    if errors:
+        return 2
+    return exit_code
+
+
+#####################
+
+parser = argparse.ArgumentParser(description='Normalize logs (timestamps, addresses, thread ids, pids, uptime '
+                                             'decorations) so that they can be compared.')
+
+parser.add_argument("-v", "--verbose", dest="is_verbose", default=False,
+                    help="Debug output", action="store_true")
+
+parser.add_argument("-o", "--output", dest="output", default=None, metavar="FILE",
+                    help="Write the normalized log to FILE instead of stdout.")
+
+parser.add_argument("--rules", dest="rules", default=None, metavar="RULE,...",
+                    help="Rules to apply, from: " + ",".join(RULE_NAMES) + ". Default: all.")
+
+parser.add_argument("--add-rule", dest="added_rules", default=[], nargs=2, action="append",
+                    metavar=("REGEX", "REPLACEMENT"),
+                    help="Additional rule (python regex, applied per line with ^ and $ matching at line "
+                         "boundaries; the replacement may use \\1 etc). Can be given several times.")
+
+parser.add_argument("--diff", dest="diff", default=False, action="store_true",
+                    help="Compare two logs: normalize both and show the differences (diff -u). The exit code "
+                         "is the one of diff: 0 if the normalized logs are equal, 1 if not.")
+
+parser.add_argument("--chunk-size", dest="chunk_size", default=16 * 1024 * 1024, type=int, metavar="BYTES",
+                    help=argparse.SUPPRESS)
+
+# positional args
+parser.add_argument("logs", default=["-"], nargs='*', metavar="LOG",
+                    help="Log file, or - for stdin (default). Two log files with --diff.")
+
+args = parser.parse_args()
+if args.is_verbose:
+    trc(str(args))
+
+all_rules = compile_rules()
+
+try:
+    if args.diff:
+        if len(args.logs) != 2:
+            error_exit("--diff needs two log files.")
+        sys.stdout.flush()
+        sys.exit(diff_logs(args.logs[0], args.logs[1], all_rules))
+
+    if len(args.logs) > 1:
+        error_exit("Only one log file, please (or use --diff).")
+    if args.output is not None:
+        with open(args.output, mode='wb') as output_file:
+            normalize_file(args.logs[0], output_file, all_rules)
+    else:
+        normalize_file(args.logs[0], sys.stdout.buffer, all_rules)
+        sys.stdout.flush()
+except BrokenPipeError:
+    # e.g. piped into head
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    sys.exit(1)
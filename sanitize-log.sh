@@ -1,5 +1,7 @@
 #! /bin/bash
 
-cat "$1" | sed 's/^\[[0-9,.smh]*\]//g' | sed 's/0x[0-9a-f]*/0x????/g'
- 
+# Removes uptime decorations and masks addresses (and more), so that two logs can be compared.
+#
+# This is now done by sanitize-log.py; see there for more options, e.g. --diff.
 
+exec python3 "$(dirname "$0")/sanitize-log.py" "$@"
@@ -0,0 +1,454 @@
+# !/usr/bin/env python3
+
+# Scans a build log in a single pass and extracts all compiler invocations: source file, flags and
+# (for logs written by run_builds.py) the time the compilation started.
+# The log is memory mapped and read line by line, so memory use does not depend on the log size.
+#
+# Note: make only prints compile command lines if run with LOG=cmdlines (or LOG=debug), wrapped as
+# "Executing: [<command line>]". Newer JDKs can also write compile_commands.json themselves
+# (make compile-commands), without building; this script works for all JDKs and for logs of real builds.
+#
+# By default, prints the same as scan-build-log.sh did: the list of compiled hotspot files, and
+# the includes and defines used to compile os.cpp.
+#
+# With --compile-commands, writes (or updates) a compile_commands.json for IDEs and clang tools.
+#
+# With --compile-times, ranks the translation units by compile time; with --compare-log, compares them with
+# another build, e.g. fastdebug against fastdebug-nopch to see what precompiled headers buy per file.
+
+
+import pathlib
+import sys
+import os
+import argparse
+import json
+import mmap
+import re
+import shlex
+import collections
+
+
+def trc(text):
+    print("--- " + text)
+
+
+def error_exit(text):
+    print('*** ERROR: ' + text)
+    sys.exit(':-(')
+
+
+def verbose(text):
+    if args.is_verbose:
+        print("--- " + text)
+
+
+# timestamp prefix run_builds.py puts in front of every line ("[12.345s] ")
+timestamp_regex = re.compile(rb'^\[(\d+\.\d+)s\] ')
+
+# start time of the step, as written by run_builds.py into the log header
+started_regex = re.compile(rb'^# started: .* \((\d+(?:\.\d+)?)\)')
+
+compiler_regex = re.compile(r'(?:^|/)(?:[\w.-]+-)?(?:g\+\+|gcc|c\+\+|cc|clang\+\+|clang|xlc\+\+|xlclang\+\+)(?:-[\d.]+)?$')
+
+source_extensions = (".cpp", ".c", ".cc")
+
+# options whose argument is specific to the compiled file; these are not part of the flag set
+per_file_options_with_argument = {"-o", "-MF", "-MT", "-MQ"}
+per_file_options = {"-c", "-MMD", "-MD", "-MP"}
+
+
+# LOG=cmdlines wraps the command lines: "Executing: [<command line>]", possibly followed by more
+cmdline_wrapper_regex = re.compile(r'^Executing: \[(.*)\]')
+
+
+# Split a compile command line into tokens. Command lines may contain quoted defines
+# (e.g. -DVERSION='"17"'), so we try shlex first.
+def split_command_line(line):
+    try:
+        return shlex.split(line)
+    except ValueError:
+        return line.split()
+
+
+# Given a log line, return a dict describing the compiler invocation, or None if the line is no compile line:
+#   'file'     - the compiled source file
+#   'compiler' - the compiler
+#   'flags'    - the flags, without the per file options (-c, -o <object>, dependency file options)
+#   'object'   - the object file, or None
+#   'directory' - the directory the compiler runs in, if the command line changes into one (cd <dir> && ...),
+#                 otherwise None
+def parse_compile_line(line):
+    m = cmdline_wrapper_regex.match(line)
+    if m is not None:
+        line = m.group(1)
+    tokens = split_command_line(line)
+    compiler_index = None
+    directory = None
+    for i, token in enumerate(tokens):
+        if compiler_regex.search(token):
+            compiler_index = i
+            break
+        if token == "cd" and i + 1 < len(tokens):
+            directory = tokens[i + 1]
+    if compiler_index is None:
+        return None
+    source_file = None
+    object_file = None
+    flags = []
+    skip_next = False
+    tokens = tokens[compiler_index:]
+    for i, token in enumerate(tokens[1:], start=1):
+        if skip_next:
+            skip_next = False
+            continue
+        if token in per_file_options_with_argument:
+            if token == "-o" and i + 1 < len(tokens):
+                object_file = tokens[i + 1]
+            skip_next = True
+        elif token in per_file_options:
+            continue
+        elif token.endswith(source_extensions) and not token.startswith("-"):
+            source_file = token
+        elif token in (")", "&&", ";", "|") or token.startswith(">"):
+            # end of the compiler command (wrapped in a subshell, or redirections)
+            break
+        else:
+            flags.append(token)
+    if source_file is None:
+        return None
+    return {'file': source_file, 'compiler': tokens[0], 'flags': flags, 'object': object_file, 'directory': directory}
+
+
+# end of the step, as written by run_builds.py into the log footer
+finished_regex = re.compile(rb'^# finished: exit code -?\d+ after (\d+(?:\.\d+)?)s')
+
+# summary line of gcc -ftime-report: "TOTAL : <usr> <sys> <wall> ..."
+time_report_regex = re.compile(rb'^\s*TOTAL\s*:\s*([\d.]+)\s+([\d.]+)\s+([\d.]+)')
+
+
+# Scan the log file. Yields one dict per compiler invocation (see parse_compile_line), with more entries:
+#   'time'        - seconds since the start of the build step, or None if the log has no timestamps
+#   'started'     - start of the build step as epoch time (from the log header), or None
+#   'time-report' - wall clock seconds from gcc -ftime-report output, or None. Reports are matched to the
+#                   compilations in the order they started, which is only exact without parallel make jobs.
+#                   Since the report comes after the compile line, this is filled in later.
+# If log_info (a dict) is given, 'started' and 'finished' (seconds since start) of the step are stored in it.
+def scan_log(log_file_name, log_info=None):
+    if log_info is None:
+        log_info = {}
+    log_info['started'] = None
+    log_info['finished'] = None
+    waiting_for_time_report = collections.deque()
+    with open(log_file_name, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw_line in iter(mm.readline, b""):
+                if raw_line.startswith(b"# "):
+                    m = started_regex.match(raw_line)
+                    if m is not None:
+                        log_info['started'] = float(m.group(1))
+                    m = finished_regex.match(raw_line)
+                    if m is not None:
+                        log_info['finished'] = float(m.group(1))
+                    continue
+                # cheap prefilters before we do any real work on the line
+                if b"TOTAL" in raw_line and len(waiting_for_time_report) > 0:
+                    m = time_report_regex.match(timestamp_regex.sub(b"", raw_line))
+                    if m is not None:
+                        waiting_for_time_report.popleft()['time-report'] = float(m.group(3))
+                        continue
+                if b" -c " not in raw_line or (b".c" not in raw_line):
+                    continue
+                elapsed = None
+                m = timestamp_regex.match(raw_line)
+                if m is not None:
+                    elapsed = float(m.group(1))
+                    raw_line = raw_line[m.end():]
+                invocation = parse_compile_line(raw_line.decode('utf-8', errors='replace').strip())
+                if invocation is not None:
+                    invocation['time'] = elapsed
+                    invocation['started'] = log_info['started']
+                    invocation['time-report'] = None
+                    if "-ftime-report" in invocation['flags']:
+                        waiting_for_time_report.append(invocation)
+                    yield invocation
+
+
+# Collect the compile flags per file. Identical flag sets are shared, so memory depends on the number of
+# compiled files and distinct flag sets, not on the size of the log.
+# Returns (dict file -> invocation, dict flag set (tuple) -> list of files)
+def collect_invocations(log_file_name, log_info=None):
+    invocations = {}
+    flag_sets = {}
+    for invocation in scan_log(log_file_name, log_info):
+        flags = tuple(invocation['flags'])
+        if flags in flag_sets:
+            # share the tuple we already have
+            files = flag_sets[flags]
+            flags = invocations[files[0]]['flags']
+        else:
+            files = flag_sets[flags] = []
+        invocation['flags'] = flags
+        files.append(invocation['file'])
+        invocations[invocation['file']] = invocation
+    return invocations, flag_sets
+
+
+def hotspot_relative_path(file_name):
+    index = file_name.find('src/hotspot/')
+    return file_name[index:] if index != -1 else None
+
+
+def print_compiled_hotspot_files(invocations):
+    print("List of compiled C++ Files:")
+    files = set()
+    for file_name in invocations:
+        relative = hotspot_relative_path(file_name)
+        if relative is not None and relative.endswith(".cpp"):
+            files.add(relative)
+    for f in sorted(files):
+        print(f)
+    print()
+
+
+def find_invocation(invocations, name):
+    for file_name, invocation in invocations.items():
+        if file_name == name or file_name.endswith("/" + name):
+            return invocation
+    return None
+
+
+def print_includes_and_defines(invocations, name):
+    invocation = find_invocation(invocations, name)
+    if invocation is None:
+        trc("No compile line found for " + name + ".")
+        return
+    print("List of Includes:")
+    for flag in invocation['flags']:
+        if flag.startswith("-I"):
+            print(flag)
+    print()
+    print("List of Defines:")
+    for flag in invocation['flags']:
+        if flag.startswith("-D"):
+            print(flag)
+
+
+def print_per_file_flags(invocations):
+    for file_name in sorted(invocations):
+        print(file_name + ": " + " ".join(invocations[file_name]['flags']))
+
+
+def print_flag_sets(flag_sets):
+    trc(str(len(flag_sets)) + " distinct flag sets.")
+    for i, (flags, files) in enumerate(sorted(flag_sets.items(), key=lambda x: -len(x[1]))):
+        print("Flag set " + str(i + 1) + " (" + str(len(files)) + " files, e.g. " + files[0] + "):")
+        print("    " + " ".join(flags))
+
+
+def write_json(invocations, json_file_name):
+    with open(json_file_name, mode='w') as f:
+        json.dump(sorted(invocations.values(), key=lambda x: x['file']), f, indent=2)
+
+
+#####################
+# Compile times per translation unit. We use, in this order:
+#  - "time-report": the wall clock time gcc reports with -ftime-report
+#  - "object":      the time from the compile line in the log until the object file was written (needs a log
+#                   written by run_builds.py, which has timestamps and the start time of the step, and the
+#                   object files of that very build)
+#  - "gap":         the time until the next compilation started; only meaningful for builds with JOBS=1
+
+def compile_durations(invocations, log_info):
+    durations = {}
+    by_start = sorted((x for x in invocations.values() if x['time'] is not None), key=lambda x: x['time'])
+    next_start = {}
+    for i, invocation in enumerate(by_start):
+        if i + 1 < len(by_start):
+            next_start[invocation['file']] = by_start[i + 1]['time']
+        else:
+            next_start[invocation['file']] = log_info['finished']
+
+    for file_name, invocation in invocations.items():
+        if invocation['time-report'] is not None:
+            durations[file_name] = (invocation['time-report'], "time-report")
+            continue
+        if invocation['time'] is None:
+            continue
+        if invocation['started'] is not None and invocation['object'] is not None:
+            try:
+                object_file = os.path.join(invocation['directory'] or "", invocation['object'])
+                written = os.stat(object_file).st_mtime - invocation['started']
+                # if the object has been rebuilt after this build, its mtime does not tell us anything
+                if invocation['time'] <= written <= (log_info['finished'] or written) + 1:
+                    durations[file_name] = (written - invocation['time'], "object")
+                    continue
+            except OSError:
+                pass
+        if next_start.get(file_name) is not None:
+            durations[file_name] = (next_start[file_name] - invocation['time'], "gap")
+    return durations
+
+
+def print_compile_time_ranking(durations):
+    total = sum(d[0] for d in durations.values())
+    trc(str(len(durations)) + " translation units, " + "%.1fs" % total + " total compile time.")
+    for file_name, (seconds, method) in sorted(durations.items(), key=lambda x: -x[1][0])[:args.num]:
+        print(("%.2fs" % seconds).rjust(10) + ("%.1f%%" % (100 * seconds / total if total > 0 else 0)).rjust(8) +
+              "  " + method.ljust(12) + (hotspot_relative_path(file_name) or file_name))
+
+
+# Compare the compile times of two builds (e.g. fastdebug and fastdebug-nopch), per translation unit.
+# Files are matched by their path relative to the source root, since the builds may come from different trees.
+def print_compile_time_comparison(durations, other_durations):
+    def by_relative_path(d):
+        return {(hotspot_relative_path(f) or f): seconds for f, (seconds, method) in d.items()}
+    a = by_relative_path(durations)
+    b = by_relative_path(other_durations)
+    common = set(a) & set(b)
+    trc(str(len(common)) + " translation units in both logs; " + "%.1fs" % sum(a[f] for f in common) + " vs " +
+        "%.1fs" % sum(b[f] for f in common) + ".")
+    print("this".rjust(10) + "other".rjust(10) + "delta".rjust(10) + "  file")
+    for f in sorted(common, key=lambda x: -abs(b[x] - a[x]))[:args.num]:
+        print(("%.2fs" % a[f]).rjust(10) + ("%.2fs" % b[f]).rjust(10) + ("%+.2fs" % (b[f] - a[f])).rjust(10) +
+              "  " + f)
+
+
+#####################
+# compile_commands.json (see https://clang.llvm.org/docs/JSONCompilationDatabase.html)
+
+# Find the newest build log of an output directory: the newest make log written by run_builds.py (for
+# <codeline>/output-<variant>, in <codeline>/build-logs/<variant>), or the build.log of the build system.
+def newest_build_log(output_dir):
+    output_path = pathlib.Path(output_dir).absolute()
+    variant = output_path.name[len("output-"):] if output_path.name.startswith("output-") else output_path.name
+    logs = list(pathlib.Path(output_path.parent, "build-logs", variant).glob("make-*.log"))
+    build_log = pathlib.Path(output_dir, "build.log")
+    if build_log.is_file():
+        logs.append(build_log)
+    if len(logs) == 0:
+        return None
+    return str(max(logs, key=lambda p: p.stat().st_mtime))
+
+
+# directory: the directory for compile commands that don't change into one themselves
+def compile_command(invocation, directory):
+    if invocation.get('directory') is not None:
+        directory = invocation['directory']
+    arguments = [invocation['compiler']] + list(invocation['flags']) + ["-c"]
+    if invocation['object'] is not None:
+        arguments += ["-o", invocation['object']]
+    arguments.append(invocation['file'])
+    entry = {'directory': directory, 'file': invocation['file'], 'arguments': arguments}
+    if invocation['object'] is not None:
+        entry['output'] = invocation['object']
+    return entry
+
+
+# Write compile_commands.json. Entries of an existing compile_commands.json are kept unless the log has
+# a newer compile command for the same file, so that the logs of incremental builds (which only compile
+# a few files) can be used to refresh it.
+def write_compile_commands(invocations, compile_commands_file_name, directory):
+    entries = {}
+    try:
+        with open(compile_commands_file_name) as f:
+            for entry in json.load(f):
+                entries[entry['file']] = entry
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    num_old = len(entries)
+    for file_name, invocation in invocations.items():
+        entries[file_name] = compile_command(invocation, directory)
+    tmp_file = compile_commands_file_name + ".tmp"
+    with open(tmp_file, mode='w') as f:
+        json.dump([entries[file_name] for file_name in sorted(entries)], f, indent=2)
+    os.replace(tmp_file, compile_commands_file_name)
+    trc(compile_commands_file_name + ": " + str(len(entries)) + " entries (" + str(num_old) + " before, " +
+        str(len(invocations)) + " from the log).")
+
+
+#####################
+
+parser = argparse.ArgumentParser(description='Extract compiler invocations from a build log.')
+
+parser.add_argument("-v", "--verbose", dest="is_verbose", default=False,
+                    help="Debug output", action="store_true")
+
+parser.add_argument("--file", dest="file", default="os.cpp",
+                    help="File to print includes and defines for. Default: %(default)s.")
+
+parser.add_argument("--per-file-flags", dest="per_file_flags", default=False, action="store_true",
+                    help="Print the compile flags of every compiled file.")
+
+parser.add_argument("--flag-sets", dest="flag_sets", default=False, action="store_true",
+                    help="Print the distinct compile flag sets, and how many files use each.")
+
+parser.add_argument("--json", dest="json_file", default=None, metavar="FILE",
+                    help="Write all compiler invocations as json to FILE.")
+
+parser.add_argument("--output-dir", dest="output_dir", default=None, metavar="DIR",
+                    help="Output directory of a build. If no build log is given, use the newest build log found "
+                         "in it.")
+
+parser.add_argument("--compile-commands", dest="compile_commands", default=False, action="store_true",
+                    help="Write compile_commands.json into the output directory (or, without --output-dir, the "
+                         "current directory). Existing entries for files not compiled in this log are kept.")
+
+parser.add_argument("--compile-times", dest="compile_times", default=False, action="store_true",
+                    help="Rank translation units by compile time. Works best with logs written by run_builds.py "
+                         "(timestamps), or with -ftime-report in the compile flags. Note: -ftime-report output is "
+                         "matched to the compilations in the order they started, and without object files the time "
+                         "until the next compilation starts is used; both are only exact for builds with JOBS=1.")
+
+parser.add_argument("--compare-log", dest="compare_log", default=None, metavar="OTHER-LOG",
+                    help="--compile-times: compare with the compile times in another build log (e.g. the "
+                         "fastdebug-nopch log against the fastdebug log).")
+
+parser.add_argument("-n", "--num", dest="num", default=30, type=int,
+                    help="--compile-times: number of translation units to show. Default: %(default)s.")
+
+# positional args
+parser.add_argument("build_log", metavar="BUILD-LOG", nargs='?', default=None,
+                    help="Build log to scan.")
+
+args = parser.parse_args()
+if args.is_verbose:
+    trc(str(args))
+
+if args.build_log is None:
+    if args.output_dir is None:
+        error_exit("Please specify a build log or an output directory.")
+    args.build_log = newest_build_log(args.output_dir)
+    if args.build_log is None:
+        error_exit("Cannot find a build log in " + args.output_dir + ".")
+    verbose("Using build log " + args.build_log)
+
+if not pathlib.Path(args.build_log).is_file():
+    error_exit("Cannot find build log at " + args.build_log + ".")
+
+all_log_info = {}
+all_invocations, all_flag_sets = collect_invocations(args.build_log, all_log_info)
+verbose(str(len(all_invocations)) + " compiler invocations found.")
+
+if args.json_file is not None:
+    write_json(all_invocations, args.json_file)
+
+if args.compile_times:
+    all_durations = compile_durations(all_invocations, all_log_info)
+    if args.compare_log is not None:
+        other_log_info = {}
+        other_invocations, other_flag_sets = collect_invocations(args.compare_log, other_log_info)
+        print_compile_time_comparison(all_durations, compile_durations(other_invocations, other_log_info))
+    else:
+        print_compile_time_ranking(all_durations)
+elif args.compile_commands:
+    compile_commands_dir = str(pathlib.Path(args.output_dir if args.output_dir is not None else ".").absolute())
+    write_compile_commands(all_invocations, compile_commands_dir + "/compile_commands.json", compile_commands_dir)
+elif args.per_file_flags:
+    print_per_file_flags(all_invocations)
+elif args.flag_sets:
+    print_flag_sets(all_flag_sets)
+else:
+    print_compiled_hotspot_files(all_invocations)
+    print_includes_and_defines(all_invocations, args.file)
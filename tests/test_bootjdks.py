@@ -0,0 +1,62 @@
+# bootjdks.py is a module; these tests download boot jdk archives from file:// urls into a temporary cache.
+
+import hashlib
+import io
+import pathlib
+import sys
+import tarfile
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import bootjdks
+
+
+def make_archive(directory):
+    archive = directory / "fakejdk_linux-x64_bin.tar.gz"
+    with tarfile.open(archive, mode="w:gz") as tar:
+        content = b"#!/bin/sh\necho fake java\n"
+        member = tarfile.TarInfo("fakejdk/bin/java")
+        member.size = len(content)
+        member.mode = 0o755
+        tar.addfile(member, io.BytesIO(content))
+    return archive
+
+
+def make_entry(tmp_path, digest=None):
+    archive = make_archive(tmp_path)
+    checksum_file = tmp_path / "fakejdk_linux-x64_bin.sha256.txt"
+    if digest is None:
+        digest = hashlib.sha256(archive.read_bytes()).hexdigest()
+    checksum_file.write_text(digest + "  " + archive.name + "\n")
+    return {'url': archive.as_uri(), 'sha256-url': checksum_file.as_uri(), 'strip-components': 1}
+
+
+def test_download_verify_and_install(tmp_path):
+    entry = make_entry(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    jdks_dir = tmp_path / "jdks"
+    jdks_dir.mkdir()
+    digest = bootjdks.download_archive(entry, cache_dir)
+    assert pathlib.Path(bootjdks.archive_file(cache_dir, digest)).is_file()
+    bootjdks.install_jdk("fakejdk", entry, str(jdks_dir), cache_dir)
+    assert (jdks_dir / "fakejdk" / "bin" / "java").is_file()
+    assert bootjdks.resolve_jdk("fakejdk", str(jdks_dir), cache_dir, {'fakejdk': entry}) == str(jdks_dir / "fakejdk")
+    # the second time, the archive comes from the cache
+    assert bootjdks.download_archive(entry, cache_dir) == digest
+
+
+def test_checksum_mismatch(tmp_path):
+    entry = make_entry(tmp_path, digest="0" * 64)
+    cache_dir = tmp_path / "cache"
+    with pytest.raises(bootjdks.BootJdkError, match="Checksum mismatch"):
+        bootjdks.download_archive(entry, str(cache_dir))
+    assert list((cache_dir / "archives").iterdir()) == []
+
+
+def test_unverifiable_archive_is_refused(tmp_path):
+    entry = {'url': make_archive(tmp_path).as_uri()}
+    with pytest.raises(bootjdks.BootJdkError, match="refusing"):
+        bootjdks.download_archive(entry, str(tmp_path / "cache"))
+    assert bootjdks.download_archive(entry, str(tmp_path / "cache"), allow_unverified=True) is not None
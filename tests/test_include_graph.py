@@ -0,0 +1,41 @@
+# include-graph.py is a script; these tests run it against a small fake hotspot source tree.
+
+import pathlib
+import subprocess
+import sys
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+HOTSPOT_FILES = {
+    "share/include/jvm.h": '#include "jvm_md.h"\n',
+    "os/posix/include/jvm_md.h": '',
+    "share/precompiled/precompiled.hpp": '#include "runtime/os.hpp"\n',
+    "share/runtime/os.hpp": '',
+    "share/prims/jvm.cpp": '#include "precompiled.hpp"\n#include "jvm.h"\n',
+    "share/runtime/os.cpp": '#include "precompiled.hpp"\n#include "jvm.h"\n#include "runtime/os.hpp"\n',
+    "share/runtime/thread.cpp": '#include "precompiled.hpp"\n#include "runtime/os.hpp"\n',
+}
+
+
+def run_include_graph(tmp_path, *arguments):
+    for name, content in HOTSPOT_FILES.items():
+        path = tmp_path / "jdk" / "src" / "hotspot" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    out = subprocess.run([sys.executable, str(SCRIPT_DIR / "include-graph.py"), "-s", str(tmp_path / "jdk"),
+                          "--index", str(tmp_path / "index.json"), "--no-pch"] + list(arguments),
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert out.returncode == 0, out.stdout
+    return out.stdout.splitlines()
+
+
+def test_jvm_h_is_resolved(tmp_path):
+    lines = run_include_graph(tmp_path, "impact", "jvm.h")
+    assert "--- share/include/jvm.h: 2 translation units affected." in lines
+    assert "src/hotspot/share/prims/jvm.cpp" in lines
+    assert "src/hotspot/share/runtime/os.cpp" in lines
+
+
+def test_jvm_md_h_is_resolved(tmp_path):
+    lines = run_include_graph(tmp_path, "rank")
+    assert "     2  src/hotspot/os/posix/include/jvm_md.h" in lines
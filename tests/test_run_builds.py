@@ -0,0 +1,65 @@
+# run_builds.py is a script; these tests run it against a fake openjdk root, with a fake make on the PATH.
+
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+# A CCACHE_STATSLOG as written by ccache 4.x: a miss, a direct hit, a preprocessed hit (after a direct mode
+# miss), and a compilation that cannot be cached.
+CCACHE_STATS_LOG = """\
+# /src/hotspot/share/runtime/os.cpp
+direct_cache_miss
+preprocessed_cache_miss
+cache_miss
+local_storage_miss
+local_storage_write
+# /src/hotspot/share/runtime/thread.cpp
+direct_cache_hit
+local_storage_read_hit
+local_storage_hit
+# /src/hotspot/share/memory/arena.cpp
+direct_cache_miss
+preprocessed_cache_hit
+local_storage_read_hit
+local_storage_hit
+# /src/hotspot/share/memory/allocation.cpp
+called_for_link
+"""
+
+
+def make_openjdk_root(root):
+    with open(SCRIPT_DIR / "registry.json") as f:
+        registry = json.load(f)
+    codeline = list(registry['codelines'])[0]
+    (root / codeline / "source").mkdir(parents=True)
+    (root / "jdks" / registry['codelines'][codeline]['boot-jdk']).mkdir(parents=True)
+    return codeline
+
+
+def make_fake_make(bin_dir):
+    bin_dir.mkdir()
+    (bin_dir / "stats.log").write_text(CCACHE_STATS_LOG)
+    make = bin_dir / "make"
+    make.write_text("#!/bin/sh\n"
+                    "echo 'Compiling 4 files for BUILD_LIBJVM'\n"
+                    "[ -n \"$CCACHE_STATSLOG\" ] && cat '" + str(bin_dir / "stats.log") + "' >> \"$CCACHE_STATSLOG\"\n"
+                    "exit 0\n")
+    make.chmod(0o755)
+
+
+def test_ccache_hits_are_counted_per_compilation(tmp_path):
+    codeline = make_openjdk_root(tmp_path / "openjdk")
+    make_fake_make(tmp_path / "bin")
+    env = dict(os.environ)
+    env['PATH'] = str(tmp_path / "bin") + os.pathsep + env['PATH']
+    out = subprocess.run([sys.executable, str(SCRIPT_DIR / "run_builds.py"), "--openjdk-root",
+                          str(tmp_path / "openjdk"), "-c", codeline, "-m", "incremental", "--ccache", "--ccache-dir",
+                          str(tmp_path / "ccache"), "--no-db", "release"],
+                         env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert out.returncode == 0, out.stdout
+    summary_line = [line for line in out.stdout.splitlines() if line.startswith("---   release")][0]
+    assert "2/3 (66%)" in summary_line
@@ -0,0 +1,59 @@
+# scan-build-log.py is a script; these tests run it on build logs written with LOG=cmdlines.
+
+import json
+import pathlib
+import subprocess
+import sys
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+# make LOG=cmdlines output of a hotspot build, as written by run_builds.py (timestamp prefix)
+ABSOLUTE_PATHS_LOG = """\
+# command: make images LOG=cmdlines
+[0.512s] Compiling 2 files for BUILD_LIBJVM
+[0.733s] Executing: [/usr/bin/g++ -MMD -MF /ws/build/fastdebug/hotspot/variant-server/libjvm/objs/os.d.tmp \
+-I/ws/src/hotspot/share -I/ws/build/fastdebug/hotspot/variant-server/gensrc -DLINUX -D_GNU_SOURCE -DAMD64 \
+-DTARGET_COMPILER_gcc -std=c++14 -fPIC -fno-rtti -DTHIS_FILE='"os.cpp"' -g -O3 -c \
+-o /ws/build/fastdebug/hotspot/variant-server/libjvm/objs/os.o /ws/src/hotspot/share/runtime/os.cpp]
+[0.734s] Executing: [/usr/bin/g++ -MMD -MF /ws/build/fastdebug/hotspot/variant-server/libjvm/objs/thread.d.tmp \
+-I/ws/src/hotspot/share -I/ws/build/fastdebug/hotspot/variant-server/gensrc -DLINUX -D_GNU_SOURCE -DAMD64 \
+-DTARGET_COMPILER_gcc -std=c++14 -fPIC -fno-rtti -DTHIS_FILE='"thread.cpp"' -g -O3 -c \
+-o /ws/build/fastdebug/hotspot/variant-server/libjvm/objs/thread.o /ws/src/hotspot/share/runtime/thread.cpp]
+"""
+
+# newer JDKs run the compiler in the workspace root, with relative paths
+RELATIVE_PATHS_LOG = """\
+Executing: [cd /ws && /usr/bin/g++ -MMD -MF build/fastdebug/hotspot/variant-server/libjvm/objs/os.d.tmp \
+-Isrc/hotspot/share -DLINUX -std=c++14 -DTHIS_FILE='"os.cpp"' -c \
+-o build/fastdebug/hotspot/variant-server/libjvm/objs/os.o src/hotspot/share/runtime/os.cpp]
+"""
+
+
+def write_compile_commands(tmp_path, log):
+    (tmp_path / "make.log").write_text(log)
+    out = subprocess.run([sys.executable, str(SCRIPT_DIR / "scan-build-log.py"), "--compile-commands",
+                          "--output-dir", str(tmp_path), str(tmp_path / "make.log")],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert out.returncode == 0, out.stdout
+    with open(tmp_path / "compile_commands.json") as f:
+        return {entry['file']: entry for entry in json.load(f)}
+
+
+def test_compile_commands_from_cmdlines_log(tmp_path):
+    entries = write_compile_commands(tmp_path, ABSOLUTE_PATHS_LOG)
+    assert sorted(entries) == ["/ws/src/hotspot/share/runtime/os.cpp", "/ws/src/hotspot/share/runtime/thread.cpp"]
+    entry = entries["/ws/src/hotspot/share/runtime/os.cpp"]
+    assert entry['directory'] == str(tmp_path)
+    assert entry['output'] == "/ws/build/fastdebug/hotspot/variant-server/libjvm/objs/os.o"
+    assert entry['arguments'] == [
+        "/usr/bin/g++", "-I/ws/src/hotspot/share", "-I/ws/build/fastdebug/hotspot/variant-server/gensrc", "-DLINUX",
+        "-D_GNU_SOURCE", "-DAMD64", "-DTARGET_COMPILER_gcc", "-std=c++14", "-fPIC", "-fno-rtti",
+        '-DTHIS_FILE="os.cpp"', "-g", "-O3", "-c", "-o", "/ws/build/fastdebug/hotspot/variant-server/libjvm/objs/os.o",
+        "/ws/src/hotspot/share/runtime/os.cpp"]
+
+
+def test_compile_commands_with_relative_paths(tmp_path):
+    entries = write_compile_commands(tmp_path, RELATIVE_PATHS_LOG)
+    entry = entries["src/hotspot/share/runtime/os.cpp"]
+    assert entry['directory'] == "/ws"
+    assert entry['arguments'][-1] == "src/hotspot/share/runtime/os.cpp"